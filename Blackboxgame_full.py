@@ -11,10 +11,16 @@
 import sys
 import pygame
 from functools import wraps
-from Game_pieces import Board, Player
+from atom_editor import AtomEditor
+from engine import GameEngine
+from Game_pieces import Board
+from profiler import Profiler
 from settings import Settings, GameStats
-from random import randint
-from Graphics_classes import Button, Marker, Scoreboard
+from puzzles import PuzzleGenerator
+from replay_log import ReplayWriter, can_log
+from Graphics_classes import AssetManager, Button, DirtyRects, \
+    FontRegistry, HeatmapOverlay, MarkerLayer, ProfileOverlay, Scoreboard, \
+    TextCache
 
 
 class BlackBoxGame:
@@ -40,176 +46,239 @@ class BlackBoxGame:
 
     def __init__(self):
         """initialize the parameters for the game"""
-        self._board = None
+        self._engine = None
         self._bb_settings = Settings()
+        FontRegistry.shared().load(self._bb_settings.font_cache_path)
         self._screen = pygame.display.set_mode((self._bb_settings.screen_width,
                                                 self._bb_settings.screen_height))
-        self._player = Player()
+        self._marker_layer = MarkerLayer(self._screen)
         self._stats = GameStats(self._bb_settings)
         self._scoreboard = Scoreboard(self._bb_settings, self._screen)
-        self._image = pygame.image.load('board.bmp')
+        self._image = AssetManager.shared().get_image('board.bmp')
         self._rect = self._image.get_rect()
         self._play_mode_button_list = self.make_play_mode_buttons()
         self._replay_button_list = self.make_replay_buttons()
+        self._dirty = DirtyRects(self._screen)
+        self._sidebar_rect = pygame.Rect(
+            self._rect.right, 0, self._bb_settings.screen_width -
+            self._rect.right, self._bb_settings.screen_height)
+        self._drawn_status = None
+        self._drawn_score = None
+        # the 2nd player's atom layout while it is being placed
+        self._editor = None
+        self._drag_from = None
+        self._replay_log = ReplayWriter(self._bb_settings.replay_path)
+        self._profiler = Profiler.shared()
+        self._overlay = ProfileOverlay(
+            self._bb_settings, self._screen, pygame.Rect(
+                self._rect.right, self._bb_settings.screen_height - 260,
+                self._sidebar_rect.width, 260))
+        inner = self._bb_settings.board_size - 2
+        self._heatmap = HeatmapOverlay(
+            self._bb_settings, self._screen, pygame.Rect(
+                self._bb_settings.square_width,
+                self._bb_settings.square_height,
+                inner * self._bb_settings.square_width,
+                inner * self._bb_settings.square_height))
+        self._heatmap_on = False
 
     def setup_new_game(self):
         """setup all parameters for a fresh game"""
-        self._player = Player()
+        self._engine = None
+        self._marker_layer.clear()
         self._stats = GameStats(self._bb_settings)
         self._scoreboard = Scoreboard(self._bb_settings, self._screen)
 
     def update_board_atoms(self, list_atoms):
         """update atoms after user picks how many they want"""
-        self._board = Board(list_atoms, self._screen)
-        self._stats.update_num_atoms(len(list_atoms))
+        board_size = self._bb_settings.board_size
+        # games the record format cannot hold are played but not logged
+        log = self._replay_log if can_log(list_atoms, board_size) else None
+        self._engine = GameEngine(list_atoms, board_size, self._stats, log)
+        self._marker_layer.clear()
 
     def calculate_entry_exit(self, pos_y, pos_x):
         """calculate screen positions on grid given x, y"""
-        return (pos_y * 70 + 35), (pos_x * 70 + 35)
+        width = self._bb_settings.square_width
+        height = self._bb_settings.square_height
+        return (pos_y * width + width // 2), (pos_x * height + height // 2)
 
     @ScoreChecker.check_score
     def shoot_ray(self, entry_x, entry_y):
         """
-        checks if coordinates are valid, modifies score correctly and returns
-        exit tuple if applicable
+        shoots the ray in the game engine and places a marker for a new path
         :param entry_x: row coordinate
         :param entry_y: column coordinate
-        :return: False if incorrect location.  None if hit.  Exit Tuple else
+        :return: "Bad shot" if incorrect location, "Hit", "reflect" or exit
+        tuple otherwise
         """
-
-        # check to make sure entry_x and entry_y are valid
-        if (entry_x in [0, 9] or entry_y in [0, 9]) and \
-                self._board.get_board_item(entry_x, entry_y) != "o":
-
-            exit_tup = self._board.find_exit(entry_x, entry_y)
-            # returned 0 if hit
-            if exit_tup == 0:
-                # decrement entry only if not visited
-                marker = self.get_hit_marker()
-                circle_tuple = self.calculate_entry_exit(entry_y, entry_x)
-                marker.update_center(circle_tuple)
-                points = self._player.add_entry_exit((entry_x, entry_y), marker,
-                                                     (entry_x, entry_y))
-                self._stats.dec_player_score(points)
-                return "Hit"
-            elif exit_tup == 1:
-                # decrement entry only if not visited
-                marker = self.get_reflect_marker()
-                circle_tuple = self.calculate_entry_exit(entry_y, entry_x)
-                marker.update_center(circle_tuple)
-                points = self._player.add_entry_exit((entry_x, entry_y), marker,
-                                            (entry_x, entry_y))
-
-                self._stats.dec_player_score(points)
-
-                return "reflect"
-            else:
-                # decrement both entry and exit if not already visited
-                marker = self.get_color_marker()
-                exit_x, exit_y = exit_tup
-                circle_entry = self.calculate_entry_exit(entry_y, entry_x)
-                circle_exit = self.calculate_entry_exit(exit_y, exit_x)
-                marker.update_center(circle_entry, circle_exit)
-                points = self._player.add_entry_exit((entry_x, entry_y),
-                                                     marker, exit_tup)
-
-                self._stats.dec_player_score(points)
-                return exit_tup
+        is_new = not self._engine.get_player().has_move((entry_x, entry_y))
+        result = self._engine.shoot_ray(entry_x, entry_y)
+        if not is_new or result == "Bad shot":
+            return result
+
+        circle_entry = self.calculate_entry_exit(entry_y, entry_x)
+        if result == "Hit":
+            marker = self.get_hit_marker()
+            marker.update_center(circle_entry)
+        elif result == "reflect":
+            marker = self.get_reflect_marker()
+            marker.update_center(circle_entry)
         else:
-            # returns false if the shoot_ray point is invalid
-            return "Bad shot"
+            marker = self.get_color_marker()
+            exit_x, exit_y = result
+            circle_exit = self.calculate_entry_exit(exit_y, exit_x)
+            marker.update_center(circle_entry, circle_exit)
+        self.place_marker(marker)
+        return result
 
     @ScoreChecker.check_score
     def guess_atom(self, atom_x, atom_y):
         """
-        Checks if atom where guessed by player and decrements if not.  Removes
-        atom from list stored
+        guesses the atom in the game engine and places a marker for a new
+        guess
         :param atom_x: row coordinate
         :param atom_y: column coordinate
-        :screen: screen details
         :return: True if atom is there, False otherwise
         """
-
-        if self._board.get_board_item(atom_x, atom_y) == 'x':
-            # if there, add to player's list and remove from board list
-            marker = self.get_atom_hit()
-            circle_tuple = self.calculate_entry_exit(atom_y, atom_x)
-            marker.update_center(circle_tuple)
-            self._player.add_atom_guess((atom_x, atom_y), marker)
-            self._stats.remove_atom()
-            return True
-        else:
-            # use the true/false in add_atom_guess return logic to decrement
-            marker = self.get_atom_miss()
-            circle_tuple = self.calculate_entry_exit(atom_y, atom_x)
-            marker.update_center(circle_tuple)
-            if self._player.add_atom_guess((atom_x, atom_y), marker):
-                self._stats.dec_player_score(5)
-                return False
+        is_new = not self._engine.get_player().has_guess((atom_x, atom_y))
+        correct = self._engine.guess_atom(atom_x, atom_y)
+        if is_new:
+            if correct:
+                marker = self.get_atom_hit()
             else:
-                return False
+                marker = self.get_atom_miss()
+            marker.update_center(self.calculate_entry_exit(atom_y, atom_x))
+            self.place_marker(marker)
+        return correct
+
+    def place_marker(self, marker):
+        """add a marker to the screen and flag the squares under it"""
+        for rect in self._marker_layer.add(marker):
+            self._dirty.mark(rect)
 
     def get_color_marker(self):
-        """get color marker from board list"""
-        return self._board.get_color_marker_b()
+        """get a marker in the next path colour"""
+        return self._marker_layer.get_path_marker()
 
     def get_hit_marker(self):
         """get hit marker from board"""
-        return Marker((0, 0, 0), self._screen)
+        return self._marker_layer.get_marker((0, 0, 0))
 
     def get_reflect_marker(self):
         """get reflect white marker from board class"""
-        return Marker((255, 255, 255), self._screen)
+        return self._marker_layer.get_marker((255, 255, 255))
 
     def get_atom_hit(self):
         """get atom hit marker from board class"""
-        return Marker((0, 128, 0), self._screen)
+        return self._marker_layer.get_marker((0, 128, 0))
 
     def get_atom_miss(self):
         """get atom miss marker from board class"""
-        return Marker((255, 0, 0), self._screen)
+        return self._marker_layer.get_marker((255, 0, 0))
 
     def get_score(self):
         """returns player's score"""
         return self._stats.get_points()
 
+    def count_layouts(self):
+        """return how many atom layouts are still possible, None if unknown"""
+        if self._engine is None:
+            return None
+        return self._engine.count_layouts()
+
+    def count_placed(self):
+        """return how many atoms are placed by hand so far, None in play"""
+        if self._editor is None:
+            return None
+        return len(self._editor.get_atoms())
+
+    def get_hints(self):
+        """
+        return the edge squares not shot yet ranked by expected bits of
+        information per point, best first, as (entry tuple, score) pairs
+        """
+        if self._engine is None:
+            return []
+        return self._engine.rank_rays() or []
+
+    def finish_if_solved(self):
+        """marks the last atoms found once the rays leave only one layout"""
+        if self._engine is None:
+            return
+        for atom_x, atom_y in self._engine.finish_if_solved():
+            marker = self.get_atom_hit()
+            marker.update_center(self.calculate_entry_exit(atom_y, atom_x))
+            self.place_marker(marker)
+
     def atoms_left(self):
         """return number of atoms left to find"""
-        return self._board.get_atoms()
+        return self._stats.get_num_atoms_left()
 
     def get_entry_exit(self):
         """return player's entry/exit list"""
-        return self._player.get_moves()
+        return self._engine.get_moves()
 
     def get_atom_guess(self):
         """return player's atom guess list"""
-        return self._player.get_atom_guesses()
+        return self._engine.get_atom_guesses()
 
     def get_board_image(self):
         """return board image"""
-        return self._board.get_board_image()
+        return self._image
 
     def blitme(self):
         """Draw the board at its current location."""
         score_image, score_rect, atom_image, atom_rect = \
             self._scoreboard.get_score_image_rect(self._stats.get_points(),
-                                             self._stats.get_num_atoms_left())
+                                             self._stats.get_num_atoms_left(),
+                                             self.count_placed())
 
         self._screen.blit(score_image, score_rect)
         self._screen.blit(atom_image, atom_rect)
+        self._screen.blit(*self._scoreboard.get_layouts_image_rect(
+            self.count_layouts()))
         self._screen.blit(self._image, self._rect)
 
-    def check_events(self):
-        """Respond to key presses and mouse events."""
-        for event in pygame.event.get():
+    def check_events(self, timeout=0):
+        """
+        Sleep until an event arrives, then respond to it and anything else
+        queued behind it
+        :param timeout: most ms to wait, 0 waits for as long as it takes.  For
+        animations that need a frame even without input
+        """
+        first_event = pygame.event.wait(timeout)
+        self.handle_events([first_event] + pygame.event.get())
+
+    def handle_events(self, events):
+        """respond to events that have arrived, apart from the wait for them"""
+        for event in events:
             if event.type == pygame.QUIT:
                 sys.exit()
+            elif event.type == pygame.VIDEOEXPOSE:
+                self._dirty.mark_all()
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F2:
+                self._heatmap_on = not self._heatmap_on
+                self._dirty.mark(self._heatmap.get_rect())
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self._profiler.toggle()
+                self._dirty.mark(self._overlay.get_rect())
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F4:
+                self._profiler.export_trace(self._bb_settings.profile_path)
+            elif event.type == pygame.KEYDOWN and \
+                    self._stats.get_status() == "manual":
+                self.check_manual_key(event.key)
+            elif event.type == pygame.MOUSEBUTTONUP and \
+                    self._stats.get_status() == "manual":
+                self.check_manual_release(*event.pos)
             elif event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_x, mouse_y = pygame.mouse.get_pos()
+                mouse_x, mouse_y = event.pos
                 if self._stats.get_status() == "Start_game":
                     self.check_game_mode_button(mouse_x, mouse_y)
                 elif self._stats.get_status() == "replay":
                     self.check_replay_button(mouse_x, mouse_y)
+                elif self._stats.get_status() == "manual":
+                    self.check_manual_click(mouse_x, mouse_y)
                 else:
                     self.check_click(mouse_x, mouse_y)
 
@@ -240,53 +309,155 @@ class BlackBoxGame:
         elif button_clicked is not None and button_clicked.get_num_atom() == 2:
             sys.exit()
 
-    def manual_input(self):
-        """create manual 4 atom list"""
-        atom_list = []
-        while len(atom_list) < 4:
-            for event in pygame.event.get():
-                if event.type == pygame.MOUSEBUTTONDOWN:
-                    mouse_x, mouse_y = pygame.mouse.get_pos()
-                    column = mouse_x // 70
-                    row = mouse_y // 70
-                    if 0 < column < 9 and 0 < row < 9:
-                        if (row, column) not in atom_list:
-                            atom_list.append((row, column))
-        return atom_list
+    def is_inside(self, row, column):
+        """returns True if the square is inside the rim"""
+        last = self._bb_settings.board_size - 1
+        return 0 < row < last and 0 < column < last
+
+    def check_manual_click(self, mouse_x, mouse_y):
+        """
+        the 2nd player puts an atom on an empty square, or picks up an atom
+        to move or take off when the button is let go
+        """
+        row, column = self.find_square(mouse_x, mouse_y)
+        if not self.is_inside(row, column):
+            return
+        if self._editor.has_atom(row, column):
+            self._drag_from = row, column
+        else:
+            self._editor.add_atom(row, column)
+            self.show_editor()
+
+    def check_manual_release(self, mouse_x, mouse_y):
+        """
+        drops an atom picked up by check_manual_click: let go on the same
+        square takes it off, on an empty square moves it there
+        """
+        if self._drag_from is None:
+            return
+        square = self.find_square(mouse_x, mouse_y)
+        if square == self._drag_from:
+            self._editor.remove_atom(*square)
+        elif self.is_inside(*square):
+            self._editor.move_atom(self._drag_from, square)
+        self._drag_from = None
+        self.show_editor()
+
+    def check_manual_key(self, key):
+        """backspace undoes the last edit, enter starts play"""
+        atoms = self._editor.get_atoms()
+        if key == pygame.K_BACKSPACE:
+            self._editor.undo()
+            self.show_editor()
+        elif key in (pygame.K_RETURN, pygame.K_KP_ENTER) and atoms:
+            self._editor = None
+            self.update_board_atoms(atoms)
+            self._stats.set_status("playing")
+
+    def show_editor(self):
+        """marks the atoms being placed and the result of every edge ray"""
+        self._marker_layer.clear()
+        self._dirty.mark(self._rect)
+        for atom_x, atom_y in self._editor.get_atoms():
+            marker = self.get_atom_hit()
+            marker.update_center(self.calculate_entry_exit(atom_y, atom_x))
+            self.place_marker(marker)
+        shown = set()
+        for (entry_x, entry_y), result in self._editor.get_results().items():
+            circle_entry = self.calculate_entry_exit(entry_y, entry_x)
+            if result == 0:
+                marker = self.get_hit_marker()
+                marker.update_center(circle_entry)
+            elif result == 1:
+                marker = self.get_reflect_marker()
+                marker.update_center(circle_entry)
+            elif result in shown:
+                # the same path was marked from its other end
+                continue
+            else:
+                shown.add((entry_x, entry_y))
+                marker = self.get_color_marker()
+                exit_x, exit_y = result
+                marker.update_center(circle_entry,
+                                     self.calculate_entry_exit(exit_y,
+                                                               exit_x))
+            self.place_marker(marker)
 
     def start_game(self, num_atom):
         """Start a new game"""
 
-        # Reset the game statistics
-        self._stats.set_status("playing")
-        self.update_screen()
         if type(num_atom) == str:
-            atom_list = self.manual_input()
-            self.update_board_atoms(atom_list)
+            # the 2nd player places the atoms through the event loop,
+            # seeing every ray's result as the layout changes
+            self._editor = AtomEditor(board_size=self._bb_settings.board_size)
+            self._drag_from = None
+            self._stats.set_status("manual")
+            self.show_editor()
         else:
-            atom_list = []
-            while len(atom_list) < num_atom:
-                atom_tup = randint(1, 8), randint(1, 8)
-                if atom_tup not in atom_list:
-                    atom_list.append(atom_tup)
-            self.update_board_atoms(atom_list)
+            # Reset the game statistics
+            self._stats.set_status("playing")
+            # only layouts the rays can tell apart from every other one
+            generator = PuzzleGenerator(num_atom,
+                                        self._bb_settings.board_size)
+            self.update_board_atoms(generator.next_puzzle())
+
+    def find_square(self, mouse_x, mouse_y):
+        """return the row, column of the board square under the mouse"""
+        return (mouse_y // self._bb_settings.square_height,
+                mouse_x // self._bb_settings.square_width)
 
     def check_click(self, mouse_x, mouse_y):
         """Identify what the tuple is the player clicked on
         """
         # Change the x/y screen coordinates to grid coordinates
-        column = mouse_x // 70
-        row = mouse_y // 70
+        row, column = self.find_square(mouse_x, mouse_y)
+        last = self._bb_settings.board_size - 1
 
-        if row in [0, 9] or column in [0, 9]:
+        if row in [0, last] or column in [0, last]:
             self.shoot_ray(row, column)
-        elif 0 < row < 9 and 0 < column < 9:
+        elif 0 < row < last and 0 < column < last:
             self.guess_atom(row, column)
+        self.finish_if_solved()
 
     def update_screen(self):
-        """update images on the screen and flip to the new screen"""
-
-        # Redraw the screen during each pass through the loop.
+        """repaint only the areas that changed and push them to the screen"""
+
+        # a mode switch repaints everything, a score change the side bar
+        if self._stats.get_status() != self._drawn_status:
+            self._drawn_status = self._stats.get_status()
+            self._dirty.mark_all()
+        score = self._stats.get_points(), \
+            self._stats.get_num_atoms_left(), self.count_layouts(), \
+            self.count_placed()
+        if score != self._drawn_score:
+            self._drawn_score = score
+            self._dirty.mark(self._sidebar_rect)
+        if self._profiler.is_enabled():
+            self._dirty.mark(self._overlay.get_rect())
+        if self.is_heatmap_shown():
+            # the chances only change after a ray or a guess
+            chances = self._engine.atom_chances()
+            if chances is not None and self._heatmap.update(chances):
+                self._dirty.mark(self._heatmap.get_rect())
+
+        dirty_rects = self._dirty.take_rects()
+        if not dirty_rects:
+            return
+        for rect in dirty_rects:
+            self._screen.set_clip(rect)
+            self.draw_screen()
+        self._screen.set_clip(None)
+
+        # Make the repainted areas visible.
+        pygame.display.update(dirty_rects)
+
+    def is_heatmap_shown(self):
+        """returns True if the atom chances are shown over the board"""
+        return self._heatmap_on and self._engine is not None and \
+            self._stats.get_status() == "playing"
+
+    def draw_screen(self):
+        """draw every layer, the screen clip limits what is touched"""
         self._screen.fill(self._bb_settings.bg_color)
 
         # Redraw all markers around edge of board
@@ -300,14 +471,11 @@ class BlackBoxGame:
                 button.draw_button()
         else:
             self.blitme()
-            shoot_markers = self.get_entry_exit()
-            atom_markers = self.get_atom_guess()
-            for marker in shoot_markers.values():
-                marker[1].draw_marker()
-            for atom in atom_markers.values():
-                atom.draw_marker()
-        # Make the most recently drawn screen visible.
-        pygame.display.flip()
+            if self.is_heatmap_shown():
+                self._heatmap.draw()
+            self._marker_layer.draw()
+        if self._profiler.is_enabled():
+            self._overlay.draw(self._profiler.summary())
 
     def make_replay_buttons(self):
         """make a replay buttons"""
@@ -338,30 +506,47 @@ class BlackBoxGame:
         play_button_list.append(play_button_4a)
         play_button_5a = Button(self._screen, "5 Atoms Random", 200, 537, 5)
         play_button_list.append(play_button_5a)
-        play_button_6a = Button(self._screen, "Manual 4 Atoms", 500, 537,
+        play_button_6a = Button(self._screen, "Manual Atoms", 500, 537,
                                 "4m")
         play_button_list.append(play_button_6a)
 
         return play_button_list
 
 
+def add_profile_targets(profiler):
+    """registers the main loop phases and the game rules with a Profiler"""
+    profiler.add_target(BlackBoxGame, "update_screen")
+    profiler.add_target(BlackBoxGame, "handle_events")
+    profiler.add_target(TextCache, "render")
+    profiler.add_target(HeatmapOverlay, "update")
+    profiler.add_target(HeatmapOverlay, "draw")
+    profiler.add_target(GameEngine, "shoot_ray")
+    profiler.add_target(GameEngine, "guess_atom")
+    profiler.add_target(Board, "find_exit")
+
+
 def main():
     """Full game play code"""
 
-    pygame.init()
+    # only the display is started here, fonts start when the first one is
+    # made and the mixer and joysticks are never needed
     pygame.display.init()
 
-    # Set the pygame clock
-    clock = pygame.time.Clock()
-
     pygame.display.set_caption("Blackbox game")
+    # nothing reacts to mouse movement, so it should not wake the loop
+    pygame.event.set_blocked(pygame.MOUSEMOTION)
     current_game = BlackBoxGame()
+    profiler = Profiler.shared()
+    add_profile_targets(profiler)
+
+    # Set the pygame clock, it caps redraws during bursts of input
     clock = pygame.time.Clock()
 
     while True:
+        current_game.update_screen()
         current_game.check_events()
         clock.tick(60)
-        current_game.update_screen()
+        profiler.end_frame()
 
     pygame.quit()
 
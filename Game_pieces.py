@@ -1,232 +1,197 @@
-import pygame
-from Graphics_classes import Marker
+from array import array
+
+from bit_board import BitBoard, TABLE_SIZE_LIMIT
+from board_geometry import BOARD_SIZE, EXIT_OFFSET, decode_outcome, \
+    edge_numbers, encode_outcome
+from sparse_board import SparseBoard
+
+
+def outcome_array(num_edges):
+    """
+    returns an array of zeros, one per edge square, wide enough for an
+    outcome code plus one
+    """
+    typecode = "B" if EXIT_OFFSET + num_edges < 255 else "H"
+    return array(typecode, bytes(num_edges * array(typecode).itemsize))
 
 
 class Board:
     """class to initialize the board space and track entry and exit paths"""
 
-    def __init__(self, list_atoms, screen):
+    __slots__ = ('_board', '_num_atoms', '_edge_results')
+
+    def __init__(self, list_atoms, board_size=BOARD_SIZE):
         """initialization of board"""
-        self._board = [['' for num in range(10)] for num in range(10)]
-        self.place_atoms_corners(list_atoms)
-        self._image = pygame.image.load('board.bmp')
-        self._marker_list = []
-        self.create_markers(screen)
-        self._atom_list = list_atoms
+        if board_size > TABLE_SIZE_LIMIT:
+            self._board = SparseBoard(list_atoms, board_size)
+        else:
+            self._board = BitBoard(list_atoms, board_size)
+        self._num_atoms = len(list_atoms)
+        self._edge_results = None
 
     def get_atom_left(self):
         """return number of atoms"""
-        return len(self._atom_list)
-
-    def place_atoms_corners(self, list_atoms):
-        """places atoms on the board as 'x' and 'o' in corners"""
-        # for every atom, place an 'x' on the board
-        for atom in list_atoms:
-            row, column = atom
-            self._board[row][column] = "x"
-        # place a 'o' in each corner
-            self._board[0][0] = "o"
-            self._board[9][9] = "o"
-            self._board[9][0] = "o"
-            self._board[0][9] = "o"
-
-    def create_markers(self, screen):
-        """generate a list of markers to be attached to in-out locations"""
-        color_list = [(0, 255, 0), (255, 255, 255), (0, 200, 0),
-                      (0, 0, 128), (0, 0, 255), (200, 0, 0), (255, 100, 100),
-                      (255, 0, 230), (255, 100, 10), (115, 0, 0), (0, 255, 255)]
-
-        for color in color_list:
-            self._marker_list.append(Marker(color, screen))
-
-    def get_color_marker_b(self):
-        """return first colored marker off list"""
-        return self._marker_list.pop()
+        return self._num_atoms
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board.get_board_size()
 
     def get_board_item(self, row_pos, column_pos):
         """returns character on board at location given"""
-        return self._board[row_pos][column_pos]
-
-    def find_exit(self, entry_x, entry_y):
-        """
-        Finds the edge iteration of exit solution and then calls function to
-        complete final path finding inside game board
-        :param entry_x: entry point of row
-        :param entry_y: entry point of column
-        :return: returns None if hit, otherwise returns exit coordinate in tuple
-        """
-        # direction is step direction.  d for down, u for up, r right
-        # l for left.  first 2 are for row, column direction when added.  second
-        # 2 numbers describe the boxes "small"(subtract) or "large"(add) to
-        # either side of the "middle"
-
-        if entry_x == 0:
-            direction = [1, 0, 0, 1, "d"]
-        elif entry_x == 9:
-            direction = [-1, 0, 0, 1, "u"]
-        elif entry_y == 0:
-            direction = [0, 1, 1, 0, "r"]
-        elif entry_y == 9:
-            direction = [0, -1, 1, 0, "l"]
-
-        next_middle, next_large, next_small = \
-            self.pull_locations(entry_x, entry_y, direction)
-
-        # hit or reflection coming right off the edge
-        if next_middle == 'x':
-            return 0
-        elif next_large == 'x' or next_small == 'x':
-            return 1
-
-        # otherwise enter the game board and ultimately return tuple
-        else:
-            entry_x = entry_x + direction[0]
-            entry_y = entry_y + direction[1]
-            return self.follow_path(entry_x, entry_y, direction)
+        return self._board.get_board_item(row_pos, column_pos)
 
-    def follow_path(self, entry_x, entry_y, direction):
+    def build_edge_results(self):
         """
-        2nd part of find_exit() to loop through game board "path"
-        :param entry_x: entry of game board x
-        :param entry_y: entry of game board y
-        :param direction: direction of travel
-        :return: None if a "hit" is found, otherwise return exit coord in tuple
+        traces a ray from every legal edge square once.  The atoms never move
+        after __init__ so the results hold for the rest of the game
+        :return: array of board_geometry outcome codes in edge_cells order
         """
+        board_size = self.get_board_size()
+        edges = edge_numbers(board_size)[0]
+        self._edge_results = outcome_array(len(edges))
+        for num, (entry_x, entry_y) in enumerate(edges):
+            self._edge_results[num] = encode_outcome(
+                self.trace_exit(entry_x, entry_y), board_size)
+        return self._edge_results
 
-        while entry_x not in [0, 9] and entry_y not in [0,9]:
-
-            next_middle, next_large, next_small = \
-                self.pull_locations(entry_x, entry_y, direction)
-
-            # found a "hit" return None
-            if next_middle == 'x':
-                return 0
-            else:
-                direction = self.calculate_direction(next_large, next_small,
-                                                     direction)
-            # advance to the next square
-            entry_x = entry_x + direction[0]
-            entry_y = entry_y + direction[1]
-
-        return entry_x, entry_y
-
-    def pull_locations(self, entry_x, entry_y, direction):
+    def find_exit(self, entry_x, entry_y):
         """
-        Helper function to simplify follow path.  Pulls board locations for
-        next_middle, next_large, next_small
-        :param entry_x: location on board in row
-        :param entry_y: location on board in column
-        :param direction: direciton travelling
-        :return: next_middle, next_large, next_small
+        looks up the result of a ray from the precomputed edge results,
+        building them on first use
+        :param entry_x: entry point of row
+        :param entry_y: entry point of column
+        :return: returns 0 if hit, 1 if reflection, otherwise exit tuple
         """
-
-        # pull next "middle" of 3 in play pieces from board and return
-        next_middle = self._board[entry_x + direction[0]][
-            entry_y + direction[1]]
-        # pull next "towards bottom/right" of 3 in play pieces from board
-        next_large = self._board[entry_x + direction[0] + direction[2]] \
-            [entry_y + direction[1] + direction[3]]
-        # pull next "towards upper/left of 3 in play pieces from board
-        next_small = self._board[entry_x + direction[0] - direction[2]] \
-            [entry_y + direction[1] - direction[3]]
-
-        return next_middle, next_large, next_small
-
-    def calculate_direction(self, next_large, next_small, direction):
+        if self._edge_results is None:
+            self.build_edge_results()
+        board_size = self.get_board_size()
+        num = edge_numbers(board_size)[1].get((entry_x, entry_y))
+        if num is None:
+            return self.trace_exit(entry_x, entry_y)
+        return decode_outcome(self._edge_results[num], board_size)
+
+    def trace_exit(self, entry_x, entry_y):
         """
-        calculate direction based on next_large, next_small and return direction
-        :param next_large: location on board next large
-        :param next_small: location on board next small
-        :param direction: current direction
-        :return: new direction
+        follows a ray from an edge square through the board core
+        :param entry_x: entry point of row
+        :param entry_y: entry point of column
+        :return: returns 0 if hit, 1 if reflection, otherwise exit tuple
         """
-        # (go down for left/right or go right for up/down previous)
-        if next_small == 'x':
-            # if both are 'x' then have to do a 180
-            if next_large == 'x':
-                if direction[4] == 'u':
-                    direction = [1, 0, 0, 1, "d"]
-                elif direction[4] == 'd':
-                    direction = [-1, 0, 0, 1, "u"]
-                elif direction[4] == 'r':
-                    direction = [0, -1, 1, 0, "l"]
-                elif direction[4] == 'l':
-                    direction = [0, 1, 1, 0, "r"]
-            # otherwise just take the appropriate 90 degree turn
-            elif direction[4] == 'u' or direction[4] == 'd':
-                direction = [0, 1, 1, 0, "r"]
-            elif direction[4] == 'l' or direction[4] == 'r':
-                direction = [1, 0, 0, 1, "d"]
-
-        # (go up for left/right or go left for up/down previous)
-        elif next_large == 'x':
-            if direction[4] == 'u' or direction[4] == 'd':
-                direction = [0, -1, 1, 0, "l"]
-            elif direction[4] == 'l' or direction[4] == 'r':
-                direction = [-1, 0, 0, 1, "u"]
-
-        return direction
+        return self._board.trace(entry_x, entry_y)
 
 
 class Player:
-    """Class to track the player's move/guess locations"""
+    """
+    Class to track the player's move/guess locations.  Moves are kept as
+    one small integer per edge square and guesses as two bit masks, so a
+    player costs a few dozen bytes however long the game runs
+    """
 
-    def __init__(self):
+    __slots__ = ('_board_size', '_moves', '_guessed', '_found')
+
+    def __init__(self, board_size=BOARD_SIZE):
         """moves will track the players previous moves and guesses"""
-        self._moves = {}
-        self._atom_guess = {}
+        self._board_size = board_size
+        # outcome code + 1 per edge square, 0 if not visited.  Made on the
+        # first ray so idle players do not carry it
+        self._moves = None
+        # squares guessed and squares guessed right, bit row * size + column
+        self._guessed = 0
+        self._found = 0
+
+    def copy(self):
+        """return a separate Player with the same moves and guesses"""
+        player = Player(self._board_size)
+        if self._moves is not None:
+            player._moves = array(self._moves.typecode, self._moves)
+        player._guessed = self._guessed
+        player._found = self._found
+        return player
+
+    def square_bit(self, square):
+        """return the mask bit of a board square"""
+        row, column = square
+        if not (0 <= row < self._board_size and
+                0 <= column < self._board_size):
+            raise ValueError("square %s is not on the board" % (square,))
+        return 1 << (row * self._board_size + column)
 
     def get_moves(self):
-        """returns the list of entry and exit the player has visited"""
-        return self._moves
+        """
+        returns dictionary of every edge square visited to its ray result:
+        0 for a hit, 1 for a reflection or the square at the other end
+        """
+        moves = {}
+        if self._moves is None:
+            return moves
+        edges = edge_numbers(self._board_size)[0]
+        for num, code in enumerate(self._moves):
+            if code:
+                moves[edges[num]] = decode_outcome(code - 1, self._board_size)
+        return moves
 
     def get_atom_guesses(self):
-        """returns atom guesses"""
-        return self._atom_guess
-
-    def add_atom_guess(self, guess, marker):
+        """returns dictionary of guessed squares to True if an atom was there"""
+        guesses = {}
+        guessed = self._guessed
+        while guessed:
+            bit = guessed & -guessed
+            guesses[divmod(bit.bit_length() - 1, self._board_size)] = \
+                bool(self._found & bit)
+            guessed ^= bit
+        return guesses
+
+    def has_move(self, entry):
+        """returns True if the edge square has been visited by a ray"""
+        num = edge_numbers(self._board_size)[1].get(tuple(entry))
+        return num is not None and self._moves is not None and \
+            self._moves[num] != 0
+
+    def has_guess(self, guess):
+        """returns True if the square has been guessed"""
+        return bool(self._guessed & self.square_bit(guess))
+
+    def add_atom_guess(self, guess, correct):
         """
         checks if a guess is in player's history and returns true and adds
         the guess and decrements how many are left.  Otherwise returns false
         :param guess: current guess tuple being taken
+        :param correct: True if an atom was at the guess
         :return: True if not in previous guesses, false otherwise
         """
-        if guess in self._atom_guess:
+        bit = self.square_bit(guess)
+        if self._guessed & bit:
             return False
-        else:
-            self._atom_guess[guess] = marker
-            return True
+        self._guessed |= bit
+        if correct:
+            self._found |= bit
+        return True
 
-    def add_entry_exit(self, entry, marker_obj, exit_tup=None):
+    def add_entry_exit(self, entry, exit_tup=None):
         """
         accepts an entry and optional exit tuple and checks if either are in
         previous history.  If both are, no decrement.  if one or the other are
         then decrement player score by 1.  If neither, dec 2
         :param entry: entry tuple
-        :param marker_obj: marker to be placed in dictionary
-        :param exit_tup: exit tuple
-        :return: none
+        :param exit_tup: exit tuple, or 0 for a hit and 1 for an edge reflection
+        :return: points to take off the player's score
         """
-        count = 0
-        # check if the entry tuple has already been added to dictionary
-        if entry not in self._moves.keys():
-            # if it hasn't, check if exit tuple is not default
-            if exit_tup not in [0, 1]:
-                # add them both and add the "reverse" trip
-                self._moves[entry] = [exit_tup, marker_obj]
-                self._moves[exit_tup] = [entry, marker_obj]
-                # 1 for a reflection, 2 for other paths
-                if exit_tup == entry:
-                    count += 1
-                else:
-                    count += 2
-            else:
-                # just add the entry.  This represents a Hit or edge reflection
-                self._moves[entry] = None
-                count += 1
-
-        return count
-
-
-
+        edges, numbers = edge_numbers(self._board_size)
+        if self._moves is None:
+            self._moves = outcome_array(len(edges))
+        entry_num = numbers[tuple(entry)]
+        # check if the entry has already been visited
+        if self._moves[entry_num]:
+            return 0
 
+        if exit_tup in [0, 1]:
+            # just add the entry.  This represents a Hit or edge reflection
+            self._moves[entry_num] = exit_tup + 1
+            return 1
+        # add them both and add the "reverse" trip
+        exit_num = numbers[tuple(exit_tup)]
+        self._moves[entry_num] = EXIT_OFFSET + exit_num + 1
+        self._moves[exit_num] = EXIT_OFFSET + entry_num + 1
+        # 1 for a reflection, 2 for other paths
+        return 1 if exit_num == entry_num else 2
@@ -1,6 +1,210 @@
+import json
+import os
+from collections import OrderedDict
+
 import pygame
 
 
+class FontRegistry:
+    """
+    Class to make each font once per name and size.  Names are resolved to
+    font files once; with a cache file the resolved paths are kept between
+    runs, so the slow system font scan only happens the first time a name
+    is seen on a machine.  The default font (name None) ships with pygame
+    and never needs a scan
+    """
+
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        """return the registry shared by every font in the game"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, cache_path=None):
+        """
+        initialize a registry
+        :param cache_path: JSON file of resolved font paths, None to resolve
+        names again every run
+        """
+        self._fonts = {}
+        self._paths = {}
+        self._cache_path = None
+        if cache_path is not None:
+            self.load(cache_path)
+
+    def load(self, cache_path):
+        """
+        reads resolved font paths saved by an earlier run and saves new ones
+        there from now on.  Paths whose file has gone are resolved again
+        :param cache_path: JSON file of font name to font file path
+        """
+        self._cache_path = cache_path
+        try:
+            with open(cache_path) as cache:
+                paths = json.load(cache)
+        except (OSError, ValueError):
+            return
+        for name, path in paths.items():
+            if path is None or os.path.exists(path):
+                self._paths.setdefault(name, path)
+
+    def save(self):
+        """writes the resolved font paths to the cache file, if there is one"""
+        if self._cache_path is None:
+            return
+        try:
+            with open(self._cache_path, "w") as cache:
+                json.dump(self._paths, cache, indent=1, sort_keys=True)
+        except OSError:
+            # an unwritable cache only costs the next run a font scan
+            pass
+
+    def get_path(self, name):
+        """
+        return the font file for a name, None for pygame's default font
+        :param name: font name as SysFont takes it, None for the default
+        """
+        if name is None:
+            return None
+        if name not in self._paths:
+            # the system font scan happens here, at most once per name
+            self._paths[name] = pygame.font.match_font(name)
+            self.save()
+        return self._paths[name]
+
+    def get_font(self, name, size):
+        """return one shared Font per name and size"""
+        font = self._fonts.get((name, size))
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = pygame.font.Font(self.get_path(name), size)
+            self._fonts[name, size] = font
+        return font
+
+
+class TextCache:
+    """
+    Class to keep rendered text surfaces so a string is only rasterised the
+    first time it is drawn.  The least recently used surfaces are dropped
+    once the cache is full
+    """
+
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        """return the cache shared by every text drawn in the game"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, max_entries=128):
+        """initialize an empty cache"""
+        self._max_entries = max_entries
+        self._surfaces = OrderedDict()
+
+    def get_font(self, name, size):
+        """return the shared Font of a name and size from the FontRegistry"""
+        return FontRegistry.shared().get_font(name, size)
+
+    def render(self, font, text, color, background=None):
+        """
+        return the rendered text, drawing it only if it is not cached
+        :param font: pygame font to draw with
+        :param text: string to draw
+        :param color: text colour
+        :param background: background colour, None for transparent
+        :return: text surface, shared so callers must not draw on it
+        """
+        key = (font, text, color, background)
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = font.render(text, True, color, background)
+            self._surfaces[key] = surface
+            if len(self._surfaces) > self._max_entries:
+                self._surfaces.popitem(last=False)
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
+
+
+class AssetManager:
+    """
+    Class to load each image once and convert it to the display's pixel
+    format, so blits are straight copies.  Everyone gets the same surface
+    """
+
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        """return the asset manager shared by the whole game"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, folder=None):
+        """
+        initialize an empty cache
+        :param folder: where the images live, the game's folder by default
+        """
+        if folder is None:
+            folder = os.path.dirname(os.path.abspath(__file__))
+        self._folder = folder
+        self._images = {}
+        self._converted = set()
+
+    def get_image(self, file_name):
+        """
+        return the image, loading it on first use and converting it as soon
+        as a display mode has been set
+        :param file_name: image file name inside the asset folder
+        :return: shared surface, callers must not draw on it
+        """
+        if file_name not in self._images:
+            self._images[file_name] = pygame.image.load(
+                os.path.join(self._folder, file_name))
+        if file_name not in self._converted and \
+                pygame.display.get_surface() is not None:
+            self._images[file_name] = self._images[file_name].convert()
+            self._converted.add(file_name)
+        return self._images[file_name]
+
+    def get_circle(self, color, radius):
+        """
+        return a filled circle drawn once per colour and radius, on a colour
+        keyed square so blitting it draws just the circle
+        :param color: circle colour
+        :param radius: circle radius in pixels
+        :return: shared surface, callers must not draw on it
+        """
+        key = ('circle', tuple(color), radius)
+        if key not in self._images:
+            size = radius * 2 + 2
+            color_key = (0, 0, 0) if tuple(color) != (0, 0, 0) \
+                else (255, 255, 255)
+            circle = pygame.Surface((size, size))
+            circle.fill(color_key)
+            pygame.draw.circle(circle, color, (radius + 1, radius + 1),
+                               radius)
+            circle.set_colorkey(color_key, pygame.RLEACCEL)
+            self._images[key] = circle
+        if key not in self._converted and \
+                pygame.display.get_surface() is not None:
+            self._images[key] = self._images[key].convert()
+            self._converted.add(key)
+        return self._images[key]
+
+    def clear(self):
+        """forget every image, e.g. after the display format changes"""
+        self._images = {}
+        self._converted = set()
+
+
 class Button:
     """Class to describe a button"""
 
@@ -13,7 +217,7 @@ class Button:
             self._width, self._height = 400, 100
             self._button_color = (0, 0, 140)
             self._text_color = (255, 255, 255)
-            self._font = pygame.font.SysFont(None, 28)
+            self._font = TextCache.shared().get_font(None, 28)
             self._num_atom = num_atom
 
             # Build the button's rect object and center it
@@ -27,7 +231,7 @@ class Button:
             self._width, self._height = 200, 100
             self._button_color = (0, 0, 140)
             self._text_color = (255, 255, 255)
-            self._font = pygame.font.SysFont(None, 28)
+            self._font = TextCache.shared().get_font(None, 28)
             self._num_atom = num_atom
 
             # Build the button's rect object and center it
@@ -39,8 +243,9 @@ class Button:
 
     def prep_msg(self, msg):
         """msg is not a rendered image and center text on the button"""
-        self.msg_image = self._font.render(msg, True, self._text_color,
-                                          self._button_color)
+        self.msg_image = TextCache.shared().render(self._font, msg,
+                                                   self._text_color,
+                                                   self._button_color)
         self.msg_image_rect = self.msg_image.get_rect()
         self.msg_image_rect.center = self._rect.center
 
@@ -58,29 +263,141 @@ class Button:
         return self._num_atom
 
 
+class DirtyRects:
+    """Class to collect the areas of the screen that need repainting"""
+
+    def __init__(self, screen):
+        """starts with the whole screen dirty so the first frame is drawn"""
+        self._screen_rect = screen.get_rect()
+        self._rects = [self._screen_rect.copy()]
+
+    def mark(self, rect):
+        """add an area that changed"""
+        self._rects.append(pygame.Rect(rect))
+
+    def mark_all(self):
+        """repaint the whole screen on the next frame"""
+        self._rects = [self._screen_rect.copy()]
+
+    def take_rects(self):
+        """return the dirty areas clipped to the screen and start over"""
+        rects = []
+        for rect in self._rects:
+            rect = rect.clip(self._screen_rect)
+            if rect.width and rect.height and \
+                    not any(old.contains(rect) for old in rects):
+                rects.append(rect)
+        self._rects = []
+        return rects
+
+
 class Marker:
     """Class to model a pair of markers for the entry, exit locations/atoms"""
+
+    __slots__ = ('_screen', '_circle_center', '_circle_color',
+                 '_circle_rad', '_image')
+
     def __init__(self, color, screen):
         """initialization of marker variables"""
         self._screen = screen
-        self._screen_circle = self._screen.get_rect()
         self._circle_center = (0, 0), (0, 0)
-        self._circle_color = color
-        # Build the button's rect object and center it
         self._circle_rad = 30
+        self.set_color(color)
+
+    def set_color(self, color):
+        """change the colour, picking up the pre-rendered circle for it"""
+        self._circle_color = color
+        self._image = AssetManager.shared().get_circle(color,
+                                                       self._circle_rad)
 
     def draw_marker(self):
         """Draw a blank marker(s) for entry/exit/atom"""
-        pygame.draw.circle(self._screen, self._circle_color,
-                           self._circle_center[0], self._circle_rad)
-        if self._circle_center[1] != (0, 0):
-            pygame.draw.circle(self._screen, self._circle_color,
-                               self._circle_center[1], self._circle_rad)
+        self._screen.blits(self.get_blits(), doreturn=False)
 
     def update_center(self, center_entry, center_exit=(0, 0)):
         """updates center once marker has been assigned"""
         self._circle_center = center_entry, center_exit
 
+    def get_rects(self):
+        """return the screen rects covered by the marker's circle(s)"""
+        rects = []
+        for center in self._circle_center:
+            if center != (0, 0):
+                rect = self._image.get_rect()
+                rect.center = center
+                rects.append(rect)
+        return rects
+
+    def get_blits(self):
+        """return (image, position) pairs for the marker's circle(s)"""
+        return [(self._image, rect.topleft) for rect in self.get_rects()]
+
+
+class MarkerLayer:
+    """
+    Class to keep the markers on screen, hand out recycled markers and draw
+    them all in one batch of blits
+    """
+
+    # first colours handed out for paths, in order.  Generated colours
+    # follow once these run out
+    path_colors = [(0, 255, 255), (115, 0, 0), (255, 100, 10), (255, 0, 230),
+                   (255, 100, 100), (200, 0, 0), (0, 0, 255), (0, 0, 128),
+                   (0, 200, 0), (255, 255, 255), (0, 255, 0)]
+
+    def __init__(self, screen):
+        """initialization of an empty layer"""
+        self._screen = screen
+        self._markers = []
+        self._pool = []
+        self._palette = self.make_palette()
+
+    def make_palette(self):
+        """yield path colours, the fixed ones first and then new hues"""
+        for color in self.path_colors:
+            yield color
+        hue = 0.0
+        while True:
+            # golden angle steps keep neighbouring hues far apart
+            hue = (hue + 137.5) % 360
+            color = pygame.Color(0, 0, 0)
+            color.hsva = (hue, 90, 90, 100)
+            yield color.r, color.g, color.b
+
+    def clear(self):
+        """return every marker to the pool and start the colours over"""
+        self._pool.extend(self._markers)
+        self._markers = []
+        self._palette = self.make_palette()
+
+    def get_marker(self, color):
+        """return a marker of the given colour, recycled if possible"""
+        if self._pool:
+            marker = self._pool.pop()
+            marker.set_color(color)
+            marker.update_center((0, 0))
+            return marker
+        return Marker(color, self._screen)
+
+    def get_path_marker(self):
+        """return a marker in the next path colour"""
+        return self.get_marker(next(self._palette))
+
+    def add(self, marker):
+        """
+        put a marker on screen
+        :return: screen rects the marker covers
+        """
+        self._markers.append(marker)
+        return marker.get_rects()
+
+    def draw(self):
+        """draw every marker with a single batch of blits"""
+        blit_list = []
+        for marker in self._markers:
+            blit_list.extend(marker.get_blits())
+        self._screen.blits(blit_list, doreturn=False)
+
 
 class Scoreboard:
     """class to describe the score board operations"""
@@ -96,13 +413,8 @@ class Scoreboard:
 
         current_score = "Lets get started!"
         num_atoms = "Atoms to be found!"
-        self._score_image = self._bb_settings.font.render(current_score, True,
-                                             self._bb_settings.text_color,
-                                             self._bb_settings.bg_color)
-
-        self._atom_image = self._bb_settings.font.render(num_atoms, True,
-                                             self._bb_settings.text_color,
-                                             self._bb_settings.bg_color)
+        self._score_image = self.render_text(current_score)
+        self._atom_image = self.render_text(num_atoms)
         # Display the score at the top right of the screen.
         self._score_rect = self._score_image.get_rect()
         self._score_rect.right = self._screen_rect.right - 20
@@ -112,25 +424,155 @@ class Scoreboard:
         self._atom_rect.right = self._screen_rect.right - 20
         self._atom_rect.top = 80
 
-    def get_score_image_rect(self, points, atom_left):
-        """returns score image and rect"""
+    def render_text(self, text):
+        """return score board text from the shared text cache"""
+        font = TextCache.shared().get_font(self._bb_settings.font_name,
+                                           self._bb_settings.font_size)
+        return TextCache.shared().render(font, text,
+                                         self._bb_settings.text_color,
+                                         self._bb_settings.bg_color)
+
+    def get_score_image_rect(self, points, atom_left, placed=None):
+        """
+        returns score image and rect
+        :param placed: atoms placed so far while a layout is set by hand,
+        None during play
+        """
         current_score = str(points) + " Points"
-        if points <= 0:
+        if placed is not None:
+            num_atoms = str(placed) + " Atoms placed"
+        elif points <= 0:
             num_atoms = "You lost!"
         elif atom_left > 0:
             num_atoms = str(atom_left) + " Atoms left"
         else:
             num_atoms = "You Won!"
 
-        self._score_image = self._bb_settings.font.render(current_score, True,
-                                             self._bb_settings.text_color,
-                                             self._bb_settings.bg_color)
-
-        self._atom_image = self._bb_settings.font.render(num_atoms, True,
-                                             self._bb_settings.text_color,
-                                             self._bb_settings.bg_color)
+        self._score_image = self.render_text(current_score)
+        self._atom_image = self.render_text(num_atoms)
 
         return self._score_image, self._score_rect, \
                self._atom_image, self._atom_rect
 
+    def get_layouts_image_rect(self, num_layouts):
+        """returns image and rect of how many atom layouts are possible"""
+        if num_layouts is None:
+            text = ""
+        elif num_layouts == 1:
+            text = "1 layout possible"
+        else:
+            text = str(num_layouts) + " layouts possible"
+
+        self._layouts_image = self.render_text(text)
+        self._layouts_rect = self._layouts_image.get_rect(
+            right=self._screen_rect.right - 20, top=140)
+        return self._layouts_image, self._layouts_rect
+
+
+class ProfileOverlay:
+    """
+    class to draw a Profiler's rolling frame and call times in a corner of
+    the screen.  The numbers change every frame, so the lines are rendered
+    straight from the font instead of going through the TextCache
+    """
+
+    def __init__(self, bb_settings, screen, rect):
+        """
+        initialize the overlay
+        :param bb_settings: game Settings
+        :param screen: surface to draw on
+        :param rect: area of the screen the overlay covers
+        """
+        self._bb_settings = bb_settings
+        self._screen = screen
+        self._rect = pygame.Rect(rect)
+        self._font = TextCache.shared().get_font(None, 18)
+
+    def get_rect(self):
+        """return the area of the screen the overlay covers"""
+        return self._rect
+
+    def get_lines(self, summary):
+        """return the overlay text for a Profiler summary"""
+        frame = summary["frame"]
+        lines = ["frame p50 %.2f p99 %.2f ms" % (frame["p50_ms"],
+                                                 frame["p99_ms"]),
+                 "dropped %d of last %d" % (frame["dropped"],
+                                            frame["window"])]
+        for label, stats in sorted(summary.items()):
+            if label != "frame":
+                lines.append("%s %.2f/%.2f" % (label.split(".")[-1],
+                                               stats["p50_ms"],
+                                               stats["p99_ms"]))
+        return lines
+
+    def draw(self, summary):
+        """draws the lines of a Profiler summary over the overlay area"""
+        self._screen.fill(self._bb_settings.bg_color, self._rect)
+        top = self._rect.top + 4
+        for line in self.get_lines(summary):
+            image = self._font.render(line, True,
+                                      self._bb_settings.text_color)
+            if top + image.get_height() > self._rect.bottom:
+                break
+            self._screen.blit(image, (self._rect.left + 4, top))
+            top += image.get_height() + 2
+
+
+class HeatmapOverlay:
+    """
+    class to shade each square inside the rim by the chance of an atom on
+    it, from blue for unlikely to red for certain.  The chances become one
+    pixel a square through surfarray and are scaled up to the board in one
+    call, so a new picture costs no per square drawing and an unchanged one
+    is only blitted
+    """
+
+    def __init__(self, bb_settings, screen, rect):
+        """
+        initialize the overlay with nothing to show
+        :param bb_settings: game Settings
+        :param screen: surface to draw on
+        :param rect: area of the screen inside the rim
+        """
+        self._bb_settings = bb_settings
+        self._screen = screen
+        self._rect = pygame.Rect(rect)
+        self._chances = None
+        self._image = None
+
+    def get_rect(self):
+        """return the area of the screen the overlay covers"""
+        return self._rect
+
+    def update(self, chances):
+        """
+        makes the picture for new chances
+        :param chances: inner x inner array of the chance of an atom on each
+        square, rows first
+        :return: True if the picture changed
+        """
+        import numpy as np
+        import pygame.surfarray
+
+        if self._chances is not None and np.array_equal(chances,
+                                                        self._chances):
+            return False
+        self._chances = chances.copy()
+        # surfarray arrays are indexed by x, then y
+        shade = chances.T[:, :, None]
+        low = np.array(self._bb_settings.heatmap_low_color)
+        high = np.array(self._bb_settings.heatmap_high_color)
+        pixels = pygame.Surface(shade.shape[:2], pygame.SRCALPHA)
+        pygame.surfarray.blit_array(pixels, (low + (high - low) * shade)
+                                    .astype(np.uint8))
+        alpha = pygame.surfarray.pixels_alpha(pixels)
+        alpha[...] = chances.T * self._bb_settings.heatmap_alpha
+        del alpha
+        self._image = pygame.transform.scale(pixels, self._rect.size)
+        return True
 
+    def draw(self):
+        """draws the latest picture, if there is one"""
+        if self._image is not None:
+            self._screen.blit(self._image, self._rect)
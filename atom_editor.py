@@ -0,0 +1,153 @@
+from board_geometry import BOARD_SIZE, edge_numbers
+from sparse_board import SparseBoard
+
+
+class AtomEditor:
+    """
+    class to place atoms by hand while every edge ray's result stays up to
+    date.  Each ray remembers the squares it looked at, and a reverse index
+    from board lines to the rays that looked along them finds the rays an
+    edit can change.  Only those are traced again, so an edit costs a few
+    rays however big the board is.  Edits can be undone
+    """
+
+    def __init__(self, list_atoms=(), board_size=BOARD_SIZE):
+        """
+        traces every edge ray once over the starting atoms
+        :param list_atoms: list of (row, column) atom tuples to start with
+        :param board_size: squares along one side of the board, rim included
+        """
+        self._board = SparseBoard((), board_size)
+        for row, column in list_atoms:
+            self.check_square(row, column)
+            self._board.add_atom(row, column)
+        self._edges = edge_numbers(board_size)[0]
+        self._results = [None] * len(self._edges)
+        self._strips = [()] * len(self._edges)
+        # one dictionary per direction, vertical strips second: centre line
+        # to a dictionary of ray number to its strips' (first, last) ranges
+        self._index = ({}, {})
+        self._history = []
+        self._num_retraced = 0
+        for num in range(len(self._edges)):
+            self.retrace(num)
+
+    def check_square(self, row, column):
+        """raises ValueError unless the square is inside the rim"""
+        last = self._board.get_board_size() - 1
+        if not (0 < row < last and 0 < column < last):
+            raise ValueError("square %s is not inside the board"
+                             % ((row, column),))
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board.get_board_size()
+
+    def get_atoms(self):
+        """return sorted list of (row, column) atom tuples"""
+        return self._board.get_atoms()
+
+    def has_atom(self, row, column):
+        """returns True if an atom sits on the square"""
+        return self._board.has_atom(row, column)
+
+    def get_result(self, entry):
+        """return the find_exit result of the ray from an edge square"""
+        return self._results[edge_numbers(self.get_board_size())[1][entry]]
+
+    def get_results(self):
+        """return dictionary of every edge square to its ray's result"""
+        return dict(zip(self._edges, self._results))
+
+    def get_num_retraced(self):
+        """return rays traced since the editor was made"""
+        return self._num_retraced
+
+    def retrace(self, num):
+        """
+        traces one ray again and moves its strips in the index
+        :param num: ray number, its edge square's place in edge_cells
+        :return: True if the result changed
+        """
+        for vertical, line, first, last in self._strips[num]:
+            rays = self._index[vertical].get(line)
+            # a ray that comes back along a line has several strips on it
+            if rays is not None and rays.pop(num, None) is not None and \
+                    not rays:
+                del self._index[vertical][line]
+        result, strips = self._board.trace_strips(*self._edges[num])
+        for vertical, line, first, last in strips:
+            self._index[vertical].setdefault(line, {}).setdefault(
+                num, []).append((first, last))
+        self._strips[num] = strips
+        self._num_retraced += 1
+        changed = result != self._results[num]
+        self._results[num] = result
+        return changed
+
+    def rays_looking_at(self, row, column):
+        """return the set of ray numbers that looked at a square"""
+        rays = set()
+        for vertical, line, position in ((False, row, column),
+                                         (True, column, row)):
+            index = self._index[vertical]
+            for centre in (line - 1, line, line + 1):
+                for num, ranges in index.get(centre, {}).items():
+                    if any(first <= position <= last
+                           for first, last in ranges):
+                        rays.add(num)
+        return rays
+
+    def edit(self, removed=(), added=(), record=True):
+        """
+        takes atoms off and puts atoms on, then traces the rays that looked
+        at any of those squares
+        :param removed: squares to take atoms off
+        :param added: squares to put atoms on
+        :param record: False to leave the edit out of the undo history
+        :return: list of edge squares whose ray result changed
+        """
+        removed = [square for square in removed if self.has_atom(*square)]
+        added = [square for square in added
+                 if not self.has_atom(*square) or square in removed]
+        for square in added:
+            self.check_square(*square)
+        affected = set()
+        for square in removed + added:
+            affected |= self.rays_looking_at(*square)
+        for square in removed:
+            self._board.remove_atom(*square)
+        for square in added:
+            self._board.add_atom(*square)
+        if record and (removed or added):
+            self._history.append((removed, added))
+        return [self._edges[num] for num in sorted(affected)
+                if self.retrace(num)]
+
+    def add_atom(self, row, column):
+        """puts an atom on a square, see edit"""
+        return self.edit(added=[(row, column)])
+
+    def remove_atom(self, row, column):
+        """takes the atom off a square, see edit"""
+        return self.edit(removed=[(row, column)])
+
+    def move_atom(self, old, new):
+        """moves the atom on square old to square new, see edit"""
+        if not self.has_atom(*old) or self.has_atom(*new):
+            return []
+        return self.edit([old], [new])
+
+    def can_undo(self):
+        """returns True if there is an edit to undo"""
+        return bool(self._history)
+
+    def undo(self):
+        """
+        reverses the last edit
+        :return: list of edge squares whose ray result changed
+        """
+        if not self._history:
+            return []
+        removed, added = self._history.pop()
+        return self.edit(added, removed, record=False)
@@ -0,0 +1,165 @@
+from functools import lru_cache
+
+import numpy as np
+from bit_board import RayTables
+from board_geometry import BOARD_SIZE, HEADINGS, edge_cells, \
+    encode_outcome, entry_heading, lookahead_offsets
+
+# one bit per neighbouring square in the neighbour byte of a square
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+              (0, 1), (1, -1), (1, 0), (1, 1)]
+RUNNING = 255
+
+
+def layouts_from_atom_lists(atom_lists, board_size=BOARD_SIZE):
+    """
+    builds a stack of boolean boards from lists of atom tuples
+    :param atom_lists: iterable of lists of (row, column) atom tuples
+    :param board_size: squares along one side of the board, rim included
+    :return: N x board_size x board_size boolean array, True where an atom is
+    """
+    atom_lists = list(atom_lists)
+    layouts = np.zeros((len(atom_lists), board_size, board_size), dtype=bool)
+    for num, atom_list in enumerate(atom_lists):
+        for row, column in atom_list:
+            layouts[num, row, column] = True
+    return layouts
+
+
+def layouts_from_masks(masks, board_size=BOARD_SIZE):
+    """
+    builds a stack of boolean boards from interior bitmasks.  Bit
+    (row - 1) * (board_size - 2) + (column - 1) is set for an atom at row,
+    column
+    :param masks: sequence of integer masks, at most 64 interior squares
+    :param board_size: squares along one side of the board, rim included
+    :return: N x board_size x board_size boolean array, True where an atom is
+    """
+    inner = board_size - 2
+    masks = np.asarray(masks, dtype=np.uint64)
+    bits = np.arange(inner * inner, dtype=np.uint64)
+    interior = ((masks[:, None] >> bits) & np.uint64(1)).astype(bool)
+    layouts = np.zeros((len(masks), board_size, board_size), dtype=bool)
+    layouts[:, 1:-1, 1:-1] = interior.reshape(-1, inner, inner)
+    return layouts
+
+
+def neighbour_bytes(layouts):
+    """
+    packs the eight neighbours of every square into one byte, so a single
+    lookup tells the tracer everything around a ray
+    :param layouts: N x size x size boolean array
+    :return: flat uint8 array of N * size * size neighbour bytes
+    """
+    num_layouts, board_size = layouts.shape[0], layouts.shape[1]
+    atoms = np.flatnonzero(layouts)
+    neighbours = np.zeros(num_layouts * board_size * board_size,
+                          dtype=np.uint8)
+    # atoms never sit on the rim, so every neighbour index stays inside its
+    # own layout and no two atoms set the same bit of the same square
+    for bit, (step_row, step_column) in enumerate(NEIGHBOURS):
+        # the atom is at -step from the square whose byte gets the bit
+        neighbours[atoms - step_row * board_size - step_column] |= 1 << bit
+    return neighbours
+
+
+@lru_cache(maxsize=None)
+def transition_tables(board_size):
+    """
+    widens the RayTables state machine from the three squares in front of a
+    ray to the whole neighbour byte of its square, so each step is a single
+    lookup.  Rays carry their state as a key of state * 256 so the neighbour
+    byte can be added straight on
+    :param board_size: squares along one side of the board, rim included
+    :return: next key and square step tables indexed by key + neighbour
+    byte, square of each state, outcome code of each state (RUNNING if none)
+    """
+    tables = RayTables.for_size(board_size)
+    codes = np.arange(256)
+    bit_of = {offset: bit for bit, offset in enumerate(NEIGHBOURS)}
+    three_square_next = np.array(tables.next_state,
+                                 dtype=np.int32).reshape(-1, 8)
+
+    next_state = np.empty((tables.num_states, 256), dtype=np.int32)
+    for heading in range(len(HEADINGS)):
+        middle, large, small = [(codes >> bit_of[offset]) & 1
+                                for offset in lookahead_offsets(heading)]
+        hood = middle | large << 1 | small << 2
+        states = slice(heading, tables.hit_state, 4)
+        next_state[states] = three_square_next[states][:, hood]
+    next_state[tables.hit_state:] = three_square_next[tables.hit_state:, :1]
+
+    state_cell = np.arange(tables.num_states, dtype=np.int32) // 4
+    state_cell[tables.hit_state:] = 0
+    outcome = np.array([RUNNING if result is None else
+                        encode_outcome(result, board_size)
+                        for result in tables.outcome], dtype=np.uint8)
+
+    # finished rays stay put, so only running states move a square
+    square_step = state_cell[next_state] - state_cell[:, None]
+    square_step[outcome[next_state] != RUNNING] = 0
+    return (next_state.reshape(-1) * 256, square_step.reshape(-1),
+            state_cell, outcome)
+
+
+def trace_batch(layouts, entries=None, chunk_size=4096, check_every=4):
+    """
+    traces every entry ray through every layout at once with the rules of
+    BitBoard.trace: hit straight ahead, reflect off the edge, 90 degree
+    deflection for one diagonal atom and a 180 for two
+    :param layouts: N x size x size boolean array (see layouts_from_*)
+    :param entries: list of edge tuples, defaults to every edge square
+    :param chunk_size: layouts traced together, sized to stay in cache
+    :param check_every: steps taken between dropping finished rays
+    :return: N x len(entries) uint8 array of board_geometry outcome codes
+    """
+    layouts = np.asarray(layouts, dtype=bool)
+    board_size = layouts.shape[1]
+    if entries is None:
+        entries = edge_cells(board_size)
+    entry_states = np.array(
+        [(row * board_size + column) * 4 +
+         entry_heading(row, column, board_size) for row, column in entries],
+        dtype=np.int32)
+    results = np.empty((len(layouts), len(entries)), dtype=np.uint8)
+    for start in range(0, len(layouts), chunk_size):
+        chunk = layouts[start:start + chunk_size]
+        results[start:start + chunk_size] = \
+            trace_chunk(chunk, entry_states, check_every)
+    return results
+
+
+def trace_chunk(layouts, entry_states, check_every):
+    """
+    runs the state machine for one chunk of layouts
+    :return: len(layouts) x len(entry_states) uint8 array of outcome codes
+    """
+    num_layouts, board_size = layouts.shape[0], layouts.shape[1]
+    num_entries = len(entry_states)
+    next_key, square_step, state_cell, outcome = \
+        transition_tables(board_size)
+    neighbours = neighbour_bytes(layouts)
+
+    results = np.full(num_layouts * num_entries, RUNNING, dtype=np.uint8)
+    ray = np.arange(num_layouts * num_entries, dtype=np.int32)
+    square = np.repeat(np.arange(num_layouts, dtype=np.int32) *
+                       board_size * board_size, num_entries) + \
+        np.tile(state_cell[entry_states], num_layouts)
+    key = np.tile(entry_states * 256, num_layouts)
+
+    # no ray can visit more states than exist, finished states loop on
+    # themselves so extra steps between checks are harmless
+    for num in range(len(state_cell)):
+        lookup = key + neighbours[square]
+        key = next_key[lookup]
+        square += square_step[lookup]
+        if num % check_every == check_every - 1:
+            finished = outcome[key >> 8]
+            done = finished != RUNNING
+            results[ray[done]] = finished[done]
+            running = ~done
+            ray, square, key = ray[running], square[running], key[running]
+            if len(ray) == 0:
+                break
+
+    return results.reshape(num_layouts, num_entries)
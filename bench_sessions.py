@@ -0,0 +1,60 @@
+import argparse
+import tracemalloc
+from random import Random
+
+from board_geometry import BOARD_SIZE, edge_cells
+from engine import GameEngine
+
+
+def session_bytes(num_sessions=100000, num_atoms=4, num_rays=0,
+                  board_size=BOARD_SIZE, seed=0):
+    """
+    measures the memory held by many open games
+    :param num_sessions: games kept alive at once
+    :param num_atoms: atoms in each game
+    :param num_rays: rays shot and atoms guessed in each game before it is
+    measured, 0 for games nobody has played yet
+    :param board_size: squares along one side of the board, rim included
+    :param seed: seed for the layouts and moves
+    :return: bytes per game
+    """
+    rng = Random(seed)
+    edges = edge_cells(board_size)
+    inner = board_size - 2
+    squares = [(row, column) for row in range(1, inner + 1)
+               for column in range(1, inner + 1)]
+    layouts = [rng.sample(squares, num_atoms) for layout in range(1000)]
+    # shared ray tables are built before counting starts
+    GameEngine(layouts[0], board_size).shoot_ray(*edges[0])
+
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    for session in range(num_sessions):
+        engine = GameEngine(layouts[session % len(layouts)], board_size)
+        for ray in range(num_rays):
+            engine.shoot_ray(*rng.choice(edges))
+            engine.guess_atom(*rng.choice(squares))
+        sessions.append(engine)
+    used = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    return used / num_sessions
+
+
+def main():
+    """command line memory benchmark of open games"""
+    parser = argparse.ArgumentParser(
+        description="measure the memory held per open Blackbox game")
+    parser.add_argument("--sessions", type=int, default=100000)
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--rays", type=int, default=5,
+                        help="rays and guesses in each played game")
+    args = parser.parse_args()
+    for name, num_rays in (("idle", 0), ("played", args.rays)):
+        per_game = session_bytes(args.sessions, args.atoms, num_rays)
+        print("%s: %.0f bytes per game, %.0f MB per million" % (
+            name, per_game, per_game))
+
+
+if __name__ == '__main__':
+    main()
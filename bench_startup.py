@@ -0,0 +1,139 @@
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+START = time.perf_counter()
+
+
+def startup_phases(font_name=None):
+    """
+    starts the game the way main() does and times each step.  Run in a
+    fresh process, so nothing is imported or cached yet
+    :param font_name: font name to make after the first frame, None for
+    only the fonts the game uses
+    :return: dictionary of step to milliseconds, and whether the logic
+    modules loaded pygame and whether the system fonts were scanned
+    """
+    phases = {}
+    last = START
+
+    def lap(name):
+        nonlocal last
+        now = time.perf_counter()
+        phases[name] = (now - last) * 1000
+        last = now
+
+    for module in ("engine", "settings", "Game_pieces"):
+        importlib.import_module(module)
+    lap("logic_import_ms")
+    logic_loaded_pygame = "pygame" in sys.modules
+
+    import pygame
+    lap("pygame_import_ms")
+    pygame.display.init()
+    lap("display_init_ms")
+    from Blackboxgame_full import BlackBoxGame
+    from Graphics_classes import FontRegistry
+    lap("game_import_ms")
+    game = BlackBoxGame()
+    lap("construct_ms")
+    game.update_screen()
+    lap("first_frame_ms")
+    if font_name is not None:
+        FontRegistry.shared().get_font(font_name, 24)
+    lap("named_font_ms")
+
+    import pygame.sysfont
+    phases["total_ms"] = (last - START) * 1000
+    phases["logic_loaded_pygame"] = logic_loaded_pygame
+    phases["font_scan"] = pygame.sysfont.is_init
+    return phases
+
+
+def run_child(home, font_name=None):
+    """
+    starts the game in a new process with its own home and working folder,
+    so the font cache and replay log are the benchmark's own
+    :return: dictionary from startup_phases
+    """
+    env = dict(os.environ, HOME=home)
+    env.setdefault("SDL_VIDEODRIVER", "dummy")
+    env.setdefault("SDL_AUDIODRIVER", "dummy")
+    env["PYGAME_HIDE_SUPPORT_PROMPT"] = "1"
+    env["PYTHONPATH"] = os.pathsep.join(
+        [os.path.dirname(os.path.abspath(__file__))] +
+        [path for path in [env.get("PYTHONPATH")] if path])
+    command = [sys.executable, os.path.abspath(__file__), "--child"]
+    if font_name is not None:
+        command += ["--font", font_name]
+    output = subprocess.run(command, env=env, cwd=home, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def median_phases(runs):
+    """return the median of each timed step over runs"""
+    medians = {}
+    for name, value in runs[0].items():
+        if name.endswith("_ms"):
+            values = sorted(run[name] for run in runs)
+            medians[name] = values[len(values) // 2]
+        else:
+            medians[name] = any(run[name] for run in runs)
+    return medians
+
+
+def run_startup_benchmark(num_runs=5, font_name=None):
+    """
+    times cold starts, with no font cache, and warm starts, with the cache
+    an earlier run left
+    :param num_runs: starts of each kind, the median is kept
+    :param font_name: font name to make as well, None for the game's fonts
+    :return: dictionary of cold and warm medians
+    """
+    cold = []
+    warm = []
+    for run in range(num_runs):
+        with tempfile.TemporaryDirectory() as home:
+            cold.append(run_child(home, font_name))
+            warm.append(run_child(home, font_name))
+    return {"cold": median_phases(cold), "warm": median_phases(warm)}
+
+
+def main():
+    """command line startup benchmark"""
+    parser = argparse.ArgumentParser(
+        description="time the game's start up to its first frame")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--font", default=None,
+                        help="also make a font with this name, to time the "
+                        "system font lookup and its cache")
+    parser.add_argument("--output", default=None,
+                        help="write the results as JSON here")
+    parser.add_argument("--child", action="store_true",
+                        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(startup_phases(args.font)))
+        return
+    report = run_startup_benchmark(args.runs, args.font)
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+    print("%-20s %10s %10s" % ("", "cold", "warm"))
+    for name, cold in report["cold"].items():
+        warm = report["warm"][name]
+        if name.endswith("_ms"):
+            print("%-20s %10.1f %10.1f" % (name, cold, warm))
+        else:
+            print("%-20s %10s %10s" % (name, cold, warm))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from random import Random
+
+from Game_pieces import Board, Player
+from board_geometry import BOARD_SIZE, edge_cells
+from layouts import LayoutGenerator
+from simulate import deduce_strategy, game_seed, play_game, \
+    random_strategy
+
+# the layouts every run measures, so runs compare like with like
+SEED = 2024
+
+
+def random_layouts(num_layouts, num_atoms=4, board_size=BOARD_SIZE,
+                   seed=SEED):
+    """return a list of seeded random atom lists"""
+    rng = Random(seed)
+    inner = board_size - 2
+    squares = [(row, column) for row in range(1, inner + 1)
+               for column in range(1, inner + 1)]
+    return [rng.sample(squares, num_atoms) for layout in range(num_layouts)]
+
+
+def best_of(repeat, function):
+    """return the shortest of repeat timed calls of function, in seconds"""
+    best = None
+    for run in range(repeat):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def bench_find_exit(repeat, scale):
+    """microseconds per ray for new boards answering every edge once"""
+    layouts = random_layouts(1000 * scale)
+    edges = edge_cells()
+
+    def run():
+        for list_atoms in layouts:
+            board = Board(list_atoms)
+            for entry_x, entry_y in edges:
+                board.find_exit(entry_x, entry_y)
+    return best_of(repeat, run) / (len(layouts) * len(edges)) * 1e6
+
+
+def bench_trace_exit(repeat, scale):
+    """microseconds per ray traced without the precomputed edge results"""
+    boards = [Board(list_atoms) for list_atoms in random_layouts(500 * scale)]
+    edges = edge_cells()
+
+    def run():
+        for board in boards:
+            for entry_x, entry_y in edges:
+                board.trace_exit(entry_x, entry_y)
+    return best_of(repeat, run) / (len(boards) * len(edges)) * 1e6
+
+
+def bench_add_entry_exit(repeat, scale):
+    """microseconds per Player.add_entry_exit over whole games of rays"""
+    edges = edge_cells()
+    games = []
+    for list_atoms in random_layouts(500 * scale):
+        board = Board(list_atoms)
+        games.append([(edge, board.find_exit(*edge)) for edge in edges])
+
+    def run():
+        for moves in games:
+            player = Player()
+            for entry, result in moves:
+                player.add_entry_exit(entry, result)
+    return best_of(repeat, run) / (len(games) * len(edges)) * 1e6
+
+
+def bench_update_screen(repeat, scale):
+    """
+    milliseconds per frame drawn after a ray and per full repaint, under
+    the SDL dummy video driver
+    """
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    import pygame
+    from Blackboxgame_full import BlackBoxGame
+
+    pygame.init()
+    pygame.display.init()
+    expose = pygame.event.Event(pygame.VIDEOEXPOSE)
+    edges = edge_cells()
+    here = os.getcwd()
+    # the game appends to a replay log in the working folder
+    with tempfile.TemporaryDirectory() as folder:
+        os.chdir(folder)
+        try:
+            game = BlackBoxGame()
+            shot_frames = []
+            full_frames = []
+            for run in range(repeat * scale):
+                game.setup_new_game()
+                game.start_game(4)
+                game.update_screen()
+                for entry_x, entry_y in edges[:8]:
+                    game.shoot_ray(entry_x, entry_y)
+                    start = time.perf_counter()
+                    game.update_screen()
+                    shot_frames.append(time.perf_counter() - start)
+                game.handle_events([expose])
+                start = time.perf_counter()
+                game.update_screen()
+                full_frames.append(time.perf_counter() - start)
+        finally:
+            os.chdir(here)
+    shot_frames.sort()
+    full_frames.sort()
+    return {"update_screen_shot_ms": shot_frames[len(shot_frames) // 2] * 1e3,
+            "update_screen_full_ms": full_frames[len(full_frames) // 2] * 1e3}
+
+
+def bench_layouts(repeat, scale):
+    """millions of seeded four atom layout masks drawn a second in batches"""
+    generator = LayoutGenerator(4, seed=SEED)
+    count = 1000000 * scale
+    return count / best_of(repeat, lambda: generator.batch_masks(count)) / 1e6
+
+
+def games_per_second(strategy, num_games):
+    """return games of scripted play a second in this process"""
+    start = time.perf_counter()
+    for game in range(num_games):
+        play_game(strategy, 4, game_seed(SEED, game))
+    return num_games / (time.perf_counter() - start)
+
+
+def bench_random_games(repeat, scale):
+    """games a second of random play, start to finish"""
+    return max(games_per_second(random_strategy, 1000 * scale)
+               for run in range(repeat))
+
+
+def bench_deduce_games(repeat, scale):
+    """games a second of solver driven play, start to finish"""
+    return games_per_second(deduce_strategy, 20 * scale)
+
+
+# name: function(repeat, scale), unit, True if bigger numbers are better.
+# A function returning a dictionary reports several results under its keys
+BENCHMARKS = {
+    "find_exit": (bench_find_exit, "us/ray", False),
+    "trace_exit": (bench_trace_exit, "us/ray", False),
+    "add_entry_exit": (bench_add_entry_exit, "us/call", False),
+    "update_screen": (bench_update_screen, "ms/frame", False),
+    "layouts": (bench_layouts, "M/s", True),
+    "random_games": (bench_random_games, "games/s", True),
+    "deduce_games": (bench_deduce_games, "games/s", True),
+}
+
+
+def run_benchmarks(names=None, repeat=5, scale=1):
+    """
+    runs benchmarks
+    :param names: benchmark names to run, every one if None
+    :param repeat: timed runs of each, the best is kept
+    :param scale: multiplies the work in each run
+    :return: dictionary of results ready for JSON: python and platform
+    details and a results dictionary of name to value, unit and
+    higher_is_better
+    """
+    results = {}
+    for name in names or BENCHMARKS:
+        function, unit, higher_is_better = BENCHMARKS[name]
+        value = function(repeat, scale)
+        values = value if isinstance(value, dict) else {name: value}
+        for result_name, result in values.items():
+            results[result_name] = {"value": result, "unit": unit,
+                                    "higher_is_better": higher_is_better}
+    return {"python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": repeat,
+            "scale": scale,
+            "results": results}
+
+
+def compare(report, baseline, tolerance=0.10):
+    """
+    compares results with a stored baseline
+    :param report: dictionary from run_benchmarks
+    :param baseline: dictionary from an earlier run_benchmarks
+    :param tolerance: share a result may get worse before it is a
+    regression
+    :return: dictionary of result name to a dictionary of baseline, value,
+    change (positive is better) and regressed
+    """
+    changes = {}
+    for name, result in report["results"].items():
+        old = baseline["results"].get(name)
+        if old is None or not old["value"]:
+            continue
+        change = result["value"] / old["value"] - 1
+        if not result["higher_is_better"]:
+            change = old["value"] / result["value"] - 1
+        changes[name] = {"baseline": old["value"], "value": result["value"],
+                         "change": change, "regressed": change < -tolerance}
+    return changes
+
+
+def main():
+    """command line benchmark run"""
+    parser = argparse.ArgumentParser(
+        description="time the game's hot paths and compare with a baseline")
+    parser.add_argument("names", nargs="*",
+                        help="benchmarks to run, all of them if none: %s"
+                        % ", ".join(BENCHMARKS))
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=int, default=1)
+    parser.add_argument("--output", default=None,
+                        help="write the results as JSON here")
+    parser.add_argument("--baseline", default=None,
+                        help="JSON results of an earlier run to compare "
+                        "with, e.g. bench_baseline.json")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="share worse than the baseline that fails")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error("unknown benchmarks: %s" % ", ".join(sorted(unknown)))
+
+    report = run_benchmarks(args.names, args.repeat, args.scale)
+    if args.output is not None:
+        with open(args.output, "w") as output:
+            json.dump(report, output, indent=2)
+
+    if args.baseline is None:
+        for name, result in report["results"].items():
+            print("%-24s %12.3f %s" % (name, result["value"], result["unit"]))
+        return
+    with open(args.baseline) as baseline:
+        changes = compare(report, json.load(baseline), args.tolerance)
+    regressed = False
+    for name, result in report["results"].items():
+        change = changes.get(name)
+        if change is None:
+            print("%-24s %12.3f %-9s (no baseline)" % (
+                name, result["value"], result["unit"]))
+            continue
+        print("%-24s %12.3f %-9s %+7.1f%%%s" % (
+            name, result["value"], result["unit"], change["change"] * 100,
+            "  REGRESSION" if change["regressed"] else ""))
+        regressed = regressed or change["regressed"]
+    sys.exit(1 if regressed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+from board_geometry import BOARD_SIZE, HEADINGS, edge_cells, entry_heading, \
+    lookahead_offsets, turn
+
+# largest board size traced with RayTables, bigger boards use SparseBoard
+TABLE_SIZE_LIMIT = 32
+
+
+class RayTables:
+    """
+    class to hold the ray state machine for one board size.  A state is
+    square * 4 + heading (see board_geometry) plus one hit and one reflect
+    state.  Built once per size and shared by every BitBoard of that size
+    """
+
+    _by_size = {}
+
+    @classmethod
+    def for_size(cls, board_size=BOARD_SIZE):
+        """return the shared tables for a board size, building on first use"""
+        if board_size not in cls._by_size:
+            cls._by_size[board_size] = cls(board_size)
+        return cls._by_size[board_size]
+
+    def __init__(self, board_size):
+        """builds the lookahead masks and transition table"""
+        self.board_size = board_size
+        num_cells = board_size * board_size
+        self.hit_state = num_cells * 4
+        self.reflect_state = self.hit_state + 1
+        self.num_states = self.hit_state + 2
+
+        # interior bit masks of the middle, large, small squares of a state
+        self.lookahead = [(0, 0, 0)] * self.num_states
+        # next state indexed by state * 8 + neighbourhood, where the
+        # neighbourhood is middle | large << 1 | small << 2
+        self.next_state = []
+        # 0 for hit, 1 for reflection, exit tuple, or None while running
+        self.outcome = [None] * self.num_states
+        self.outcome[self.hit_state] = 0
+        self.outcome[self.reflect_state] = 1
+        self.entry_state = {}
+
+        edges = set(edge_cells(board_size))
+        for state in range(self.num_states):
+            self.next_state.extend(self.make_transitions(state, edges))
+
+        # every square a ray could touch going straight on from a state, and
+        # the state it finishes in if none of them hold an atom
+        self.corridor = [0] * self.num_states
+        self.run_end = list(range(self.num_states))
+        for state in range(self.num_states):
+            self.follow_corridor(state)
+
+    def cell_bit(self, row, column):
+        """return the interior mask bit of a square, 0 for rim squares"""
+        inner = self.board_size - 2
+        if 0 < row <= inner and 0 < column <= inner:
+            return 1 << ((row - 1) * inner + column - 1)
+        return 0
+
+    def follow_corridor(self, state):
+        """fills in corridor and run_end for every state on a straight run"""
+        run = []
+        # stop at a finished state or one whose run is already known
+        while self.outcome[state] is None and self.run_end[state] == state:
+            following = self.next_state[state * 8]
+            if following == state:
+                break
+            run.append(state)
+            state = following
+        corridor = self.corridor[state]
+        run_end = self.run_end[state]
+        for earlier in reversed(run):
+            middle, large, small = self.lookahead[earlier]
+            corridor |= middle | large | small
+            self.corridor[earlier] = corridor
+            self.run_end[earlier] = run_end
+
+    def make_transitions(self, state, edges):
+        """
+        fills in lookahead and outcome for a state and returns its eight
+        next states, one per neighbourhood
+        """
+        if state >= self.hit_state:
+            return [state] * 8
+        square, heading = divmod(state, 4)
+        row, column = divmod(square, self.board_size)
+        last = self.board_size - 1
+        on_rim = row in (0, last) or column in (0, last)
+
+        if (row, column) in edges:
+            if entry_heading(row, column, self.board_size) != heading:
+                # reached from the inside, the ray has left the board
+                self.outcome[state] = (row, column)
+                return [state] * 8
+            self.entry_state[row, column] = state
+        elif on_rim:
+            # corners are never entered
+            return [state] * 8
+
+        self.lookahead[state] = tuple(
+            self.cell_bit(row + off_row, column + off_column)
+            for off_row, off_column in lookahead_offsets(heading))
+
+        transitions = []
+        for hood in range(8):
+            middle, large, small = hood & 1, hood & 2, hood & 4
+            if middle:
+                transitions.append(self.hit_state)
+            elif on_rim and (large or small):
+                transitions.append(self.reflect_state)
+            else:
+                new_heading = heading if on_rim else \
+                    turn(heading, large, small)
+                step_row, step_column = HEADINGS[new_heading]
+                transitions.append(
+                    ((row + step_row) * self.board_size + column +
+                     step_column) * 4 + new_heading)
+        return transitions
+
+
+class BitBoard:
+    """
+    class to hold the atoms of a board as one integer occupancy mask of the
+    interior and trace rays through it with the shared RayTables
+    """
+
+    __slots__ = ('_mask', '_tables')
+
+    def __init__(self, list_atoms=(), board_size=BOARD_SIZE):
+        """initialization of the mask from atom tuples"""
+        self._tables = RayTables.for_size(board_size)
+        self._mask = 0
+        for row, column in list_atoms:
+            self._mask |= self._tables.cell_bit(row, column)
+
+    @classmethod
+    def from_mask(cls, mask, board_size=BOARD_SIZE):
+        """build a board straight from an interior mask"""
+        board = cls((), board_size)
+        board._mask = mask
+        return board
+
+    def get_mask(self):
+        """return the interior occupancy mask"""
+        return self._mask
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._tables.board_size
+
+    def has_atom(self, row, column):
+        """returns True if an atom sits on the square"""
+        return bool(self._mask & self._tables.cell_bit(row, column))
+
+    def get_board_item(self, row, column):
+        """returns 'x' for an atom, 'o' for a corner and '' otherwise"""
+        last = self._tables.board_size - 1
+        if row in (0, last) and column in (0, last):
+            return "o"
+        elif self.has_atom(row, column):
+            return "x"
+        return ""
+
+    def trace(self, entry_x, entry_y):
+        """
+        follows a ray from an edge square through the state machine
+        :param entry_x: entry point of row
+        :param entry_y: entry point of column
+        :return: returns 0 if hit, 1 if reflection, otherwise exit tuple
+        """
+        tables = self._tables
+        mask = self._mask
+        corridor = tables.corridor
+        lookahead = tables.lookahead
+        next_state = tables.next_state
+        state = tables.entry_state.get((entry_x, entry_y))
+        if state is None:
+            raise ValueError("entry %s is not on the edge of the board"
+                             % ((entry_x, entry_y),))
+
+        # finished states have an empty corridor, so the loop stops on them
+        while mask & corridor[state]:
+            middle, large, small = lookahead[state]
+            hood = (1 if mask & middle else 0) | \
+                (2 if mask & large else 0) | (4 if mask & small else 0)
+            state = next_state[state * 8 + hood]
+        # nothing left to turn the ray, skip to where it leaves
+        return tables.outcome[tables.run_end[state]]
@@ -0,0 +1,124 @@
+from functools import lru_cache
+
+BOARD_SIZE = 10
+
+# headings in the order Board has always listed them (down, up, right,
+# left) as row, column steps.  A ray state is square * 4 + heading, where
+# square is row * board_size + column
+HEADINGS = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+
+
+def edge_cells(board_size=BOARD_SIZE):
+    """
+    lists every rim square a ray can be shot from.  Corners are left out
+    :param board_size: squares along one side of the board, rim included
+    :return: list of (row, column) tuples, clockwise from the top left
+    """
+    last = board_size - 1
+    inner = range(1, last)
+    return ([(0, column) for column in inner] +
+            [(row, last) for row in inner] +
+            [(last, column) for column in reversed(inner)] +
+            [(row, 0) for row in reversed(inner)])
+
+
+@lru_cache(maxsize=None)
+def edge_numbers(board_size=BOARD_SIZE):
+    """
+    numbers the edge squares in edge_cells order, shared by every game of a
+    board size so a game can keep a small integer per edge square
+    :param board_size: squares along one side of the board, rim included
+    :return: tuple of edge tuples, dictionary of edge tuple to its number
+    """
+    edges = tuple(edge_cells(board_size))
+    return edges, {edge: num for num, edge in enumerate(edges)}
+
+
+def is_edge_cell(row, column, board_size=BOARD_SIZE):
+    """returns True if row, column is a rim square a ray can be shot from"""
+    last = board_size - 1
+    return (row in (0, last) and 0 < column < last) or \
+        (column in (0, last) and 0 < row < last)
+
+
+def entry_heading(row, column, board_size=BOARD_SIZE):
+    """
+    returns the heading a ray takes when shot from an edge square, checking
+    rows before columns as the original find_exit did
+    """
+    last = board_size - 1
+    if row == 0:
+        return 0
+    elif row == last:
+        return 1
+    elif column == 0:
+        return 2
+    elif column == last:
+        return 3
+    raise ValueError("entry %s is not on the edge of the board"
+                     % ((row, column),))
+
+
+def lookahead_offsets(heading):
+    """
+    returns the offsets of the three squares in front of a ray: straight
+    ahead ("middle"), ahead towards bottom/right ("large") and ahead towards
+    top/left ("small")
+    """
+    step_row, step_column = HEADINGS[heading]
+    side_row, side_column = abs(step_column), abs(step_row)
+    return ((step_row, step_column),
+            (step_row + side_row, step_column + side_column),
+            (step_row - side_row, step_column - side_column))
+
+
+def turn(heading, large, small):
+    """
+    returns the heading after passing the squares in front of a ray: a 180
+    if both diagonals hold atoms, otherwise a quarter turn away from the atom
+    :param heading: current heading
+    :param large: True if an atom is ahead towards bottom/right
+    :param small: True if an atom is ahead towards top/left
+    :return: new heading
+    """
+    vertical = heading in (0, 1)
+    if small and large:
+        return heading ^ 1
+    elif small:
+        return 2 if vertical else 0
+    elif large:
+        return 3 if vertical else 1
+    return heading
+
+
+# outcome codes used wherever ray results are stored compactly.  Hits and
+# reflections keep the 0 and 1 that Board.find_exit returns, exits are stored
+# as 2 + the position of the exit square in edge_cells()
+HIT = 0
+REFLECT = 1
+EXIT_OFFSET = 2
+
+
+def encode_outcome(result, board_size=BOARD_SIZE):
+    """
+    turns a find_exit result into a small integer code
+    :param result: 0 for hit, 1 for reflection or exit tuple
+    :param board_size: squares along one side of the board, rim included
+    :return: integer outcome code
+    """
+    if result in (HIT, REFLECT):
+        return result
+    return EXIT_OFFSET + edge_numbers(board_size)[1][tuple(result)]
+
+
+def decode_outcome(code, board_size=BOARD_SIZE):
+    """
+    turns an outcome code back into the value find_exit would return
+    :param code: integer outcome code
+    :param board_size: squares along one side of the board, rim included
+    :return: 0 for hit, 1 for reflection or exit tuple
+    """
+    code = int(code)
+    if code in (HIT, REFLECT):
+        return code
+    return edge_numbers(board_size)[0][code - EXIT_OFFSET]
@@ -0,0 +1,483 @@
+import argparse
+import atexit
+import os
+import struct
+import time
+from collections import Counter
+from functools import lru_cache
+from math import comb
+
+import numpy as np
+from batch_tracer import layouts_from_masks, trace_batch
+from bit_board import BitBoard
+from board_geometry import BOARD_SIZE, EXIT_OFFSET, decode_outcome, \
+    edge_numbers, encode_outcome
+from layouts import LayoutGenerator, masks_from_squares
+from signature_index import colex_masks, layout_rank
+from solver import LayoutSolver
+
+# layouts are kept as 64 bit masks, so boards up to 8 x 8 inside the rim
+RATE_SIZE_LIMIT = 10
+# most layouts of one atom count whose signatures are kept in memory, one
+# byte an edge each.  Above this the solver finds the layouts left instead
+TABLE_LIMIT = 1 << 21
+# points the heuristic gives each edge square by what its ray does: hit,
+# reflection off the rim, back out of its own square, straight across and
+# any other path.  Least squares fit to min_cost over 3000 random four atom
+# layouts of the 10 x 10 board, correlation about 0.65 on other layouts
+HEURISTIC_WEIGHTS = (0.25, -0.07, -0.52, 0.23, 0.19)
+
+CACHE_MAGIC = b"BBXRATE1"
+# board size after the magic, then canonical mask and min_cost records
+CACHE_HEADER = struct.Struct("<8sB")
+CACHE_RECORD = struct.Struct("<QH")
+# min_cost of a layout that some other layout answers every ray the same as
+UNRATEABLE = 0xFFFF
+
+
+@lru_cache(maxsize=None)
+def symmetries(board_size=BOARD_SIZE):
+    """
+    lists the eight rotations and reflections of the board, under which a
+    layout is just as hard
+    :return: tuple of tuples, each the square number every interior square
+    goes to
+    """
+    inner = board_size - 2
+    last = inner - 1
+    moves = [lambda row, column: (row, column),
+             lambda row, column: (column, last - row),
+             lambda row, column: (last - row, last - column),
+             lambda row, column: (last - column, row),
+             lambda row, column: (row, last - column),
+             lambda row, column: (last - row, column),
+             lambda row, column: (column, row),
+             lambda row, column: (last - column, last - row)]
+    symmetry_list = []
+    for move in moves:
+        squares = []
+        for square in range(inner * inner):
+            row, column = move(square // inner, square % inner)
+            squares.append(row * inner + column)
+        symmetry_list.append(tuple(squares))
+    return tuple(symmetry_list)
+
+
+def canonical_mask(mask, board_size=BOARD_SIZE):
+    """return the smallest interior mask of a layout's eight symmetries"""
+    squares = [square for square in range(mask.bit_length())
+               if mask >> square & 1]
+    return min(sum(1 << symmetry[square] for square in squares)
+               for symmetry in symmetries(board_size))
+
+
+def canonical_masks(masks, board_size=BOARD_SIZE):
+    """canonical_mask of every mask in a uint64 array"""
+    masks = np.asarray(masks, dtype=np.uint64)
+    inner = board_size - 2
+    bits = [(masks >> np.uint64(square)) & np.uint64(1)
+            for square in range(inner * inner)]
+    best = None
+    for symmetry in symmetries(board_size):
+        moved = np.zeros(len(masks), dtype=np.uint64)
+        for square, bit in enumerate(bits):
+            moved |= bit << np.uint64(symmetry[square])
+        best = moved if best is None else np.minimum(best, moved)
+    return best
+
+
+@lru_cache(maxsize=None)
+def opposite_numbers(board_size=BOARD_SIZE):
+    """return the number of the edge square straight across from each one"""
+    edges, numbers = edge_numbers(board_size)
+    last = board_size - 1
+    opposite = []
+    for row, column in edges:
+        if row in (0, last):
+            opposite.append(numbers[last - row, column])
+        else:
+            opposite.append(numbers[row, last - column])
+    return tuple(opposite)
+
+
+def heuristic_scores(masks, board_size=BOARD_SIZE):
+    """
+    guesses min_cost from what each ray does on its own, for sorting large
+    numbers of layouts.  Layouts full of reflections are easy, ones whose
+    rays go straight through or get swallowed are hard
+    :param masks: uint64 array of interior masks
+    :param board_size: squares along one side of the board, rim included
+    :return: float array of scores in points
+    """
+    outcomes = trace_batch(layouts_from_masks(masks, board_size))
+    edge_range = np.arange(outcomes.shape[1])
+    hits = outcomes == 0
+    reflections = outcomes == 1
+    own = outcomes == EXIT_OFFSET + edge_range
+    straight = outcomes == EXIT_OFFSET + np.array(
+        opposite_numbers(board_size))
+    other = ~(hits | reflections | own | straight)
+    counts = np.stack([hits, reflections, own, straight, other]).sum(axis=2)
+    return np.array(HEURISTIC_WEIGHTS) @ counts
+
+
+def heuristic_filter(low, high, board_size=BOARD_SIZE):
+    """
+    return an accept function for LayoutGenerator keeping layouts whose
+    heuristic score is from low to high
+    """
+    def accept(squares):
+        scores = heuristic_scores(masks_from_squares(squares), board_size)
+        return (scores >= low) & (scores <= high)
+    return accept
+
+
+def min_cover(sets, costs):
+    """
+    finds the cheapest choice of items that takes at least one item out of
+    every set, by branch and bound
+    :param sets: list of integer bitmasks of items
+    :param costs: list of the cost of each item
+    :return: total cost, bitmask of the chosen items
+    """
+    sets = sorted(set(sets), key=lambda items: bin(items).count("1"))
+    # choosing from a set also covers every set holding all of its items
+    smallest = []
+    for items in sets:
+        if not any(items & kept == kept for kept in smallest):
+            smallest.append(items)
+    cheapest = [min(costs[item] for item in range(len(costs))
+                    if items >> item & 1) for items in smallest]
+    best = [sum(costs) + 1, 0]
+
+    def search(chosen, cost):
+        # sets with no item in common need an item each
+        bound = cost
+        used = 0
+        first = None
+        for items, least in zip(smallest, cheapest):
+            if not items & chosen:
+                if first is None:
+                    first = items
+                if not items & used:
+                    used |= items
+                    bound += least
+        if bound >= best[0]:
+            return
+        if first is None:
+            best[:] = [cost, chosen]
+            return
+        for item in sorted((item for item in range(len(costs))
+                            if first >> item & 1),
+                           key=lambda item: costs[item]):
+            search(chosen | 1 << item, cost + costs[item])
+
+    search(0, 0)
+    return best[0], best[1]
+
+
+class RatingCache:
+    """
+    class to keep ratings on disk between runs, keyed by canonical mask.
+    New ratings are appended in batches, so a long run that stops early
+    keeps what it had written and a record cut short is dropped on loading
+    """
+
+    def __init__(self, path, board_size=BOARD_SIZE, flush_bytes=65536):
+        """
+        reads every rating in the file, starting it if it is new
+        :param path: file of ratings, None to keep them in memory only
+        :param board_size: squares along one side of the board, rim included
+        :param flush_bytes: bytes of new ratings held before they are written
+        """
+        self._ratings = {}
+        self._buffer = bytearray()
+        self._flush_bytes = flush_bytes
+        self._file = None
+        if path is None:
+            return
+        header = CACHE_HEADER.pack(CACHE_MAGIC, board_size)
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, "rb") as existing:
+                data = existing.read()
+            if data[:CACHE_HEADER.size] != header:
+                raise ValueError("%s is not a rating cache for a %d board"
+                                 % (path, board_size))
+            records = data[CACHE_HEADER.size:]
+            whole = len(records) - len(records) % CACHE_RECORD.size
+            self._ratings = dict(CACHE_RECORD.iter_unpack(records[:whole]))
+            self._file = open(path, "ab", buffering=0)
+            self._file.truncate(CACHE_HEADER.size + whole)
+        else:
+            self._file = open(path, "ab", buffering=0)
+            self._file.write(header)
+        atexit.register(self.close)
+
+    def __len__(self):
+        """return ratings held"""
+        return len(self._ratings)
+
+    def get(self, key):
+        """return the stored min_cost of a canonical mask, None if unrated"""
+        return self._ratings.get(key)
+
+    def add(self, key, cost):
+        """stores the min_cost of a canonical mask"""
+        self._ratings[key] = cost
+        if self._file is not None:
+            self._buffer += CACHE_RECORD.pack(key, cost)
+            if len(self._buffer) >= self._flush_bytes:
+                self.flush()
+
+    def flush(self):
+        """writes the ratings held in memory"""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        """writes what is left and closes the file"""
+        if self._file is not None and not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+class DifficultyRater:
+    """
+    class to rate atom layouts by min_cost: the fewest points, counted the
+    way Player.add_entry_exit takes them, that any shooter must spend on
+    rays before only one layout agrees with them.  A shooter who knew which
+    rays to pick would pay exactly that; no strategy pays less.
+
+    The rays are picked as a minimum hitting set, built up lazily.  Each
+    other layout rules itself out once a chosen ray comes out differently
+    for it.  Starting with no rays, the cheapest rays that rule out every
+    layout met so far are found exactly.  The layouts still agreeing with
+    them are looked up, and the ones with the fewest differing rays are
+    added.  This stops when none agree, usually after about ten rounds.
+    Layouts still agreeing are found in a table of every layout's
+    signature while one fits in TABLE_LIMIT, and by the LayoutSolver
+    otherwise
+    """
+
+    def __init__(self, board_size=BOARD_SIZE, cache_path=None):
+        """
+        initialize a rater
+        :param board_size: squares along one side of the board, rim included
+        :param cache_path: file to keep ratings in, None for none
+        """
+        if board_size > RATE_SIZE_LIMIT:
+            raise ValueError("ratings need a board of at most %d squares a "
+                             "side" % RATE_SIZE_LIMIT)
+        self._board_size = board_size
+        self._edges, self._numbers = edge_numbers(board_size)
+        self._cache = RatingCache(cache_path, board_size)
+        # atom count to the edges x layouts signature table, or None
+        self._tables = {}
+        self._num_computed = 0
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board_size
+
+    def get_cache(self):
+        """return the RatingCache"""
+        return self._cache
+
+    def get_num_computed(self):
+        """return ratings worked out rather than found in the cache"""
+        return self._num_computed
+
+    def get_table(self, num_atoms):
+        """
+        return the signature table of every layout of num_atoms atoms in
+        colex order, one row per edge, None if it would be over TABLE_LIMIT
+        """
+        if num_atoms not in self._tables:
+            inner = self._board_size - 2
+            table = None
+            if comb(inner * inner, num_atoms) <= TABLE_LIMIT:
+                masks = colex_masks(inner * inner, num_atoms)
+                table = np.empty((len(self._edges), len(masks)),
+                                 dtype=np.uint8)
+                for start in range(0, len(masks), 65536):
+                    table[:, start:start + 65536] = trace_batch(
+                        layouts_from_masks(masks[start:start + 65536],
+                                           self._board_size)).T
+            self._tables[num_atoms] = table
+        return self._tables[num_atoms]
+
+    def differences(self, mask, signature, shot, limit=8, look=4096):
+        """
+        finds other layouts the rays shot so far do not rule out
+        :param mask: interior mask of the layout being rated
+        :param signature: list of its outcome code for every edge
+        :param shot: list of edge numbers shot
+        :param limit: most layouts to return
+        :param look: most layouts agreeing to compare, the ones with the
+        fewest differences among them are returned
+        :return: list of bitmasks of the edges whose outcome differs for
+        each layout, fewest differences first.  Empty if none agree
+        """
+        num_atoms = bin(mask).count("1")
+        table = self.get_table(num_atoms)
+        if table is not None:
+            rows = None
+            for edge in shot:
+                if rows is None:
+                    rows = np.flatnonzero(table[edge] == signature[edge])
+                else:
+                    rows = rows[table[edge][rows] == signature[edge]]
+            if rows is None:
+                rows = np.arange(min(look + 1, table.shape[1]))
+            rows = rows[rows != layout_rank(mask)][:look]
+            differ = table[:, rows] != np.array(signature, dtype=np.uint8)[
+                :, None]
+            # at most 32 edges on the boards rated, so one word a layout
+            bits = np.zeros((len(rows), 4), dtype=np.uint8)
+            packed = np.packbits(differ, axis=0, bitorder="little").T
+            bits[:, :packed.shape[1]] = packed
+            diffs = bits.view(np.uint32)[:, 0]
+            fewest = np.argsort(np.bitwise_count(diffs), kind="stable")
+            return diffs[fewest[:limit]].tolist()
+
+        solver = LayoutSolver(num_atoms, self._board_size)
+        for edge in shot:
+            solver.add_shot(self._edges[edge],
+                            decode_outcome(signature[edge], self._board_size))
+        diffs = []
+        for other in solver.layouts():
+            if other == mask:
+                continue
+            board = BitBoard.from_mask(other, self._board_size)
+            diffs.append(sum(1 << num for num, edge in enumerate(self._edges)
+                             if encode_outcome(board.trace(*edge),
+                                               self._board_size) !=
+                             signature[num]))
+            if len(diffs) >= look // 64:
+                break
+        diffs.sort(key=lambda diff: bin(diff).count("1"))
+        return diffs[:limit]
+
+    def min_cost(self, list_atoms):
+        """
+        works out the cheapest rays that leave only this layout
+        :param list_atoms: list of (row, column) atom tuples
+        :return: points those rays cost, None if some other layout answers
+        every ray the same
+        """
+        board = BitBoard(list_atoms, self._board_size)
+        mask = board.get_mask()
+        results = [board.trace(*edge) for edge in self._edges]
+        signature = [encode_outcome(result, self._board_size)
+                     for result in results]
+        # a path is one item with both its ends, shooting either end shows it
+        item_of = [None] * len(self._edges)
+        item_edges = []
+        costs = []
+        for num, result in enumerate(results):
+            if item_of[num] is not None:
+                continue
+            ends = [num]
+            if result not in (0, 1) and self._numbers[result] != num:
+                ends.append(self._numbers[result])
+            for end in ends:
+                item_of[end] = len(item_edges)
+            item_edges.append(ends)
+            costs.append(len(ends))
+
+        sets = []
+        cost, chosen = 0, 0
+        while True:
+            shot = [edge for item, ends in enumerate(item_edges)
+                    if chosen >> item & 1 for edge in ends]
+            diffs = self.differences(mask, signature, shot)
+            if not diffs:
+                return cost
+            if not diffs[0]:
+                return None
+            for diff in diffs:
+                items = 0
+                for edge in range(len(self._edges)):
+                    if diff >> edge & 1:
+                        items |= 1 << item_of[edge]
+                sets.append(items)
+            cost, chosen = min_cover(sets, costs)
+
+    def rate(self, list_atoms):
+        """
+        return min_cost of a layout, from the cache when it has been rated
+        before in any rotation or reflection
+        """
+        key = canonical_mask(BitBoard(list_atoms, self._board_size)
+                             .get_mask(), self._board_size)
+        cost = self._cache.get(key)
+        if cost is None:
+            cost = self.min_cost(list_atoms)
+            self._cache.add(key, UNRATEABLE if cost is None else cost)
+            self._num_computed += 1
+        elif cost == UNRATEABLE:
+            cost = None
+        return cost
+
+    def rate_masks(self, masks):
+        """
+        rates a batch of layouts, working out each canonical layout once
+        :param masks: uint64 array of interior masks
+        :return: int array of min_cost, -1 where it is None
+        """
+        keys = canonical_masks(masks, self._board_size)
+        unique, inverse = np.unique(keys, return_inverse=True)
+        costs = np.empty(len(unique), dtype=np.int64)
+        inner = self._board_size - 2
+        for num, key in enumerate(unique.tolist()):
+            cost = self._cache.get(key)
+            if cost is None:
+                atoms = [(square // inner + 1, square % inner + 1)
+                         for square in range(key.bit_length())
+                         if key >> square & 1]
+                cost = self.min_cost(atoms)
+                cost = UNRATEABLE if cost is None else cost
+                self._cache.add(key, cost)
+                self._num_computed += 1
+            costs[num] = -1 if cost == UNRATEABLE else cost
+        return costs[inverse.reshape(-1)]
+
+
+def main():
+    """command line rating of a seeded catalogue of random layouts"""
+    parser = argparse.ArgumentParser(
+        description="rate random atom layouts by the fewest points of rays "
+        "that pin them down")
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--count", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache", default="ratings.bbxrate",
+                        help="file to keep ratings in between runs")
+    parser.add_argument("--heuristic", action="store_true",
+                        help="only work out the quick heuristic scores")
+    args = parser.parse_args()
+
+    masks = LayoutGenerator(args.atoms, seed=args.seed).batch_masks(
+        args.count)
+    start = time.perf_counter()
+    if args.heuristic:
+        scores = heuristic_scores(masks)
+        seconds = time.perf_counter() - start
+        print("mean_score: %.3f" % scores.mean())
+        print("layouts rated per second: %.0f" % (args.count / seconds))
+        return
+    rater = DifficultyRater(cache_path=args.cache)
+    costs = rater.rate_masks(masks)
+    seconds = time.perf_counter() - start
+    rater.get_cache().close()
+    for cost, count in sorted(Counter(costs.tolist()).items()):
+        print("%s: %d" % ("unrateable" if cost < 0 else "%d points" % cost,
+                          count))
+    print("worked out: %d, from the cache: %d" % (
+        rater.get_num_computed(), args.count - rater.get_num_computed()))
+    print("layouts rated per second: %.0f" % (args.count / seconds))
+
+
+if __name__ == '__main__':
+    main()
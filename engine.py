@@ -0,0 +1,205 @@
+from Game_pieces import Board, Player
+from bit_board import TABLE_SIZE_LIMIT
+from board_geometry import BOARD_SIZE, is_edge_cell
+from settings import GameStats
+from solver import LayoutSolver
+
+
+class GameEngine:
+    """
+    Class to run the rules of one Blackbox game: rays, atom guesses, the
+    score and win/loss.  Nothing here touches pygame, so games can be played
+    by scripts, bots and worker processes as well as by the window.  A game
+    only holds its packed move history until the solver or hints are asked
+    for, so a server can keep many thousands of them idle
+    """
+
+    __slots__ = ('_board', '_player', '_stats', '_solver', '_num_layouts',
+                 '_hints', '_log')
+
+    def __init__(self, list_atoms, board_size=BOARD_SIZE, stats=None,
+                 log=None):
+        """
+        initialize a game over the given atoms
+        :param list_atoms: list of (row, column) atom tuples
+        :param board_size: squares along one side of the board, rim included
+        :param stats: GameStats to keep the score in, a new one if None
+        :param log: ReplayWriter to record the game in, or None
+        """
+        self._board = Board(list_atoms, board_size)
+        self._player = Player(board_size)
+        self._stats = GameStats() if stats is None else stats
+        self._stats.update_num_atoms(len(list_atoms))
+        # built from the move history when first asked for, then kept up to
+        # date move by move.  The count is redone only when asked for after
+        # something new has been seen
+        self._solver = None
+        self._num_layouts = None
+        self._hints = None
+        self._log = log
+        if log is not None:
+            log.start_game(list_atoms, board_size, self._stats.get_points())
+
+    def get_board(self):
+        """return the board"""
+        return self._board
+
+    def get_player(self):
+        """return the player's move history"""
+        return self._player
+
+    def get_stats(self):
+        """return the score keeping"""
+        return self._stats
+
+    def get_moves(self):
+        """return player's entry/exit dictionary"""
+        return self._player.get_moves()
+
+    def get_atom_guesses(self):
+        """return player's atom guess dictionary"""
+        return self._player.get_atom_guesses()
+
+    def get_score(self):
+        """returns player's score"""
+        return self._stats.get_points()
+
+    def get_num_atoms_left(self):
+        """returns atoms still to be found"""
+        return self._stats.get_num_atoms_left()
+
+    def get_solver(self):
+        """return the layout solver, None on boards too big to solve"""
+        board_size = self._board.get_board_size()
+        if self._solver is None and board_size <= TABLE_SIZE_LIMIT:
+            self._solver = LayoutSolver.from_player(
+                self._player, self._board.get_atom_left(), board_size)
+        return self._solver
+
+    def count_layouts(self):
+        """
+        returns how many atom layouts still agree with every ray and guess,
+        None on boards too big to solve
+        """
+        if self._num_layouts is None and self.get_solver() is not None:
+            self._num_layouts = self._solver.count()
+        return self._num_layouts
+
+    def get_hints(self):
+        """return the HintEngine, None on boards too big to give hints for"""
+        if self._hints is None and self.get_solver() is not None:
+            # numpy is only needed once someone asks for a hint
+            from hints import HINT_SIZE_LIMIT, HintEngine
+            if self._board.get_board_size() <= HINT_SIZE_LIMIT:
+                self._hints = HintEngine(self._solver)
+        return self._hints
+
+    def rank_rays(self):
+        """
+        ranks the edge squares not shot yet by expected information per
+        point, see HintEngine
+        :return: list of (entry tuple, bits per point) best first, None on
+        boards too big to give hints for
+        """
+        if self.get_hints() is None:
+            return None
+        return self._hints.rank(self.get_moves())
+
+    def atom_chances(self):
+        """
+        returns the chance of an atom on each interior square given the rays
+        and guesses so far, see HintEngine
+        :return: inner x inner float array, None on boards too big to give
+        hints for
+        """
+        if self.get_hints() is None:
+            return None
+        return self._hints.atom_chances()
+
+    def finish_if_solved(self):
+        """
+        guesses the atoms still hidden once only one layout is possible
+        :return: list of (row, column) tuples guessed, empty if the game is
+        over or more than one layout is possible
+        """
+        if self.is_over() or self.count_layouts() != 1:
+            return []
+        layout = next(self._solver.layouts())
+        guessed = []
+        for atom_x, atom_y in self._solver.atom_cells(layout):
+            if not self._player.has_guess((atom_x, atom_y)):
+                self.guess_atom(atom_x, atom_y)
+                guessed.append((atom_x, atom_y))
+        return guessed
+
+    def is_lost(self):
+        """returns True once the player has run out of points"""
+        return self._stats.get_points() <= 0
+
+    def is_won(self):
+        """returns True once every atom is found with points to spare"""
+        return not self.is_lost() and self._stats.get_num_atoms_left() <= 0
+
+    def is_over(self):
+        """returns True if no more moves can be made"""
+        return self.is_lost() or self.is_won()
+
+    def shoot_ray(self, entry_x, entry_y):
+        """
+        shoots a ray from an edge square and charges the player for any new
+        entry and exit squares
+        :param entry_x: row coordinate
+        :param entry_y: column coordinate
+        :return: None if the game is over, "Bad shot" if not an edge square,
+        "Hit", "reflect" or exit tuple otherwise
+        """
+        if self.is_over():
+            return None
+        if not is_edge_cell(entry_x, entry_y, self._board.get_board_size()):
+            return "Bad shot"
+
+        exit_tup = self._board.find_exit(entry_x, entry_y)
+        points = self._player.add_entry_exit((entry_x, entry_y), exit_tup)
+        self._stats.dec_player_score(points)
+        if self._log is not None:
+            self._log.add_shot((entry_x, entry_y), exit_tup, points)
+        if points and self._solver is not None:
+            # a solver not built yet reads the move from the history later
+            self._solver.add_shot((entry_x, entry_y), exit_tup)
+            self._num_layouts = None
+            if self._hints is not None:
+                self._hints.add_shot((entry_x, entry_y), exit_tup)
+        if exit_tup == 0:
+            return "Hit"
+        elif exit_tup == 1:
+            return "reflect"
+        return exit_tup
+
+    def guess_atom(self, atom_x, atom_y):
+        """
+        guesses an atom location.  A new right guess finds the atom, a new
+        wrong guess costs 5 points, repeated guesses change nothing
+        :param atom_x: row coordinate
+        :param atom_y: column coordinate
+        :return: None if the game is over, True if an atom is there, False
+        otherwise
+        """
+        if self.is_over():
+            return None
+
+        correct = self._board.get_board_item(atom_x, atom_y) == 'x'
+        is_new = self._player.add_atom_guess((atom_x, atom_y), correct)
+        if self._log is not None:
+            self._log.add_guess((atom_x, atom_y), correct, is_new,
+                                5 if is_new and not correct else 0)
+        if is_new:
+            if self._solver is not None:
+                self._solver.add_guess((atom_x, atom_y), correct)
+                self._num_layouts = None
+                if self._hints is not None:
+                    self._hints.add_guess((atom_x, atom_y), correct)
+            if correct:
+                self._stats.remove_atom()
+            else:
+                self._stats.dec_player_score(5)
+        return correct
@@ -0,0 +1,190 @@
+from math import comb
+
+import numpy as np
+from batch_tracer import layouts_from_masks, trace_batch
+from board_geometry import EXIT_OFFSET, edge_cells, encode_outcome
+
+# layouts are kept as 64 bit masks, so boards up to 8 x 8 inside the rim
+HINT_SIZE_LIMIT = 10
+
+
+class HintEngine:
+    """
+    class to rank the rays not shot yet by how much they tell the player
+    per point spent, and to give the chance of an atom on each square.  It
+    keeps the outcome of every edge ray for each atom layout still
+    possible, all of them when there are few enough and a uniform sample
+    otherwise, and drops rows as results come in instead of searching again
+    """
+
+    def __init__(self, solver, max_layouts=20000, min_layouts=1000,
+                 seed=None):
+        """
+        initialize a hint engine over a solver's layouts
+        :param solver: LayoutSolver kept up to date with every shot and guess
+        :param max_layouts: most layouts traced, a sample is drawn above this
+        :param min_layouts: a sample smaller than this is drawn again
+        :param seed: seed for drawing samples, None for a random one
+        """
+        board_size = solver.get_board_size()
+        if board_size > HINT_SIZE_LIMIT:
+            raise ValueError("hints need a board of at most %d squares a side"
+                             % HINT_SIZE_LIMIT)
+        self._solver = solver
+        self._board_size = board_size
+        self._edges = edge_cells(board_size)
+        self._max_layouts = max_layouts
+        self._min_layouts = min_layouts
+        self._rng = np.random.default_rng(seed)
+
+        # cost of every outcome code for every edge: a hit, a reflection or
+        # a ray back out of its own square marks one square, others two
+        num_codes = EXIT_OFFSET + len(self._edges)
+        self._costs = np.full((len(self._edges), num_codes), 2.0)
+        self._costs[:, :EXIT_OFFSET] = 1.0
+        self._costs[np.arange(len(self._edges)),
+                    EXIT_OFFSET + np.arange(len(self._edges))] = 1.0
+
+        self._masks = None
+        self._outcomes = None
+        self._is_sample = False
+        # layouts in the table with an atom on each interior square
+        self._atom_counts = None
+
+    def get_num_layouts(self):
+        """return layouts in the table, None before it is built"""
+        if self._masks is None:
+            return None
+        return len(self._masks)
+
+    def is_sample(self):
+        """return True if the table holds a sample rather than every layout"""
+        return self._is_sample
+
+    def rebuild(self):
+        """traces every layout the solver allows, or a sample of them"""
+        groups = list(self._solver.partial_layouts())
+        weights = [comb(bin(free).count("1"), need)
+                   for atoms, free, need in groups]
+        total = sum(weights)
+        self._is_sample = total > self._max_layouts
+        if self._is_sample:
+            masks = self.sample_layouts(groups, weights, total)
+        else:
+            masks = np.array(list(self._solver.layouts()), dtype=np.uint64)
+        self._masks = masks
+        self._outcomes = trace_batch(
+            layouts_from_masks(masks, self._board_size))
+        self._atom_counts = self.count_atoms(masks)
+
+    def sample_layouts(self, groups, weights, total):
+        """
+        draws max_layouts layouts uniformly from the solver's groups
+        :param groups: list of (atoms, free, need) from partial_layouts
+        :param weights: layouts in each group
+        :param total: sum of the weights
+        :return: uint64 array of interior masks
+        """
+        chosen = self._rng.choice(len(groups), size=self._max_layouts,
+                                  p=np.array(weights) / total)
+        masks = []
+        for group, size in zip(*np.unique(chosen, return_counts=True)):
+            atoms, free, need = groups[group]
+            free_bits = np.array([bit for bit in range(free.bit_length())
+                                  if free >> bit & 1], dtype=np.uint64)
+            layouts = np.full(size, atoms, dtype=np.uint64)
+            if need:
+                # a random permutation of the free squares per layout, the
+                # first need of them get the atoms
+                picks = self._rng.random((size, len(free_bits))).argsort(
+                    axis=1)[:, :need]
+                layouts |= np.bitwise_or.reduce(
+                    np.uint64(1) << free_bits[picks], axis=1)
+            masks.append(layouts)
+        return np.concatenate(masks)
+
+    def count_atoms(self, masks):
+        """return how many of the masks have an atom on each interior square"""
+        inner = self._board_size - 2
+        bits = np.unpackbits(masks.astype("<u8", copy=False).view(
+            np.uint8).reshape(-1, 8), axis=1, bitorder="little")
+        return bits[:, :inner * inner].sum(axis=0, dtype=np.int64)
+
+    def keep(self, rows):
+        """drops the table rows not selected by a boolean array"""
+        # the counts follow whichever side of the split is smaller
+        if rows.sum() * 2 < len(rows):
+            self._atom_counts = self.count_atoms(self._masks[rows])
+        else:
+            self._atom_counts -= self.count_atoms(self._masks[~rows])
+        self._masks = self._masks[rows]
+        self._outcomes = self._outcomes[rows]
+        if self._is_sample and len(self._masks) < self._min_layouts:
+            # too few left to trust, sample again on the next ranking
+            self._masks = None
+
+    def add_shot(self, entry, result):
+        """
+        keeps only the layouts that give the same ray result
+        :param entry: entry tuple
+        :param result: 0 for hit, 1 for reflection or exit tuple
+        """
+        if self._masks is not None:
+            code = encode_outcome(result, self._board_size)
+            self.keep(self._outcomes[:, self._edges.index(entry)] == code)
+
+    def add_guess(self, guess, correct):
+        """
+        keeps only the layouts that agree with an atom guess
+        :param guess: (row, column) tuple guessed
+        :param correct: True if an atom was there
+        """
+        row, column = guess
+        inner = self._board_size - 2
+        # a rim square never holds an atom, so no layout is ruled out
+        if self._masks is not None and 0 < row <= inner and \
+                0 < column <= inner:
+            bit = np.uint64(1 << (row - 1) * inner + column - 1)
+            self.keep(((self._masks & bit) != 0) == correct)
+
+    def atom_chances(self):
+        """
+        works out the chance of an atom on each interior square given
+        everything seen so far, exact over every layout or estimated from
+        the sample
+        :return: inner x inner float array, all 0 if no layout agrees
+        """
+        if self._masks is None:
+            self.rebuild()
+        inner = self._board_size - 2
+        chances = self._atom_counts / max(len(self._masks), 1)
+        return chances.reshape(inner, inner)
+
+    def rank(self, shot_cells=()):
+        """
+        scores every edge square not shot yet by the expected bits of
+        information its ray gives per point it costs
+        :param shot_cells: edge squares whose result is known already
+        :return: list of (entry tuple, bits per point), best first
+        """
+        if self._masks is None:
+            self.rebuild()
+        num_layouts = len(self._masks)
+        if not num_layouts:
+            return []
+
+        num_edges, num_codes = self._costs.shape
+        counts = np.bincount(
+            (self._outcomes + np.arange(num_edges) * num_codes).reshape(-1),
+            minlength=num_edges * num_codes).reshape(num_edges, num_codes)
+        chance = counts / num_layouts
+        with np.errstate(divide="ignore", invalid="ignore"):
+            entropy = -np.where(counts, chance * np.log2(chance),
+                                0).sum(axis=1)
+        cost = (chance * self._costs).sum(axis=1)
+        score = entropy / cost
+
+        ranked = [(self._edges[edge], float(score[edge]))
+                  for edge in np.argsort(-score, kind="stable")
+                  if self._edges[edge] not in shot_cells]
+        return ranked
@@ -0,0 +1,211 @@
+from random import Random
+
+from board_geometry import BOARD_SIZE
+
+# layouts drawn without one passing the filters before giving up on them
+MAX_REJECTED = 1 << 22
+
+# layouts drawn together when an accept function is set: a batch costs
+# about as much for one layout as for this many
+ACCEPT_BATCH = 256
+
+
+def squares_to_atoms(squares, board_size=BOARD_SIZE):
+    """
+    turns square numbers back into atom tuples.  Square
+    (row - 1) * (board_size - 2) + (column - 1) is the atom at row, column,
+    the bit numbering of interior masks
+    :param squares: N x atoms array or list of lists of square numbers
+    :param board_size: squares along one side of the board, rim included
+    :return: list of lists of (row, column) atom tuples
+    """
+    inner = board_size - 2
+    return [[(square // inner + 1, square % inner + 1) for square in layout]
+            for layout in getattr(squares, "tolist", lambda: squares)()]
+
+
+def masks_from_squares(squares):
+    """
+    packs layouts into interior masks
+    :param squares: N x atoms array of square numbers below 64
+    :return: N uint64 masks
+    """
+    import numpy as np
+
+    masks = np.zeros(len(squares), dtype=np.uint64)
+    for column in range(squares.shape[1]):
+        masks |= np.left_shift(np.uint64(1), squares[:, column].astype(
+            np.uint64))
+    return masks
+
+
+class LayoutGenerator:
+    """
+    class to draw random atom layouts from a seed, one at a time for a game
+    or in large numpy batches for the simulators.  Layouts are sampled
+    straight from the allowed squares, so there is no retry loop for atoms
+    that land on each other.  Filters keep atoms away from the rim and from
+    each other, and an accept function can add any other test, such as a
+    difficulty range
+    """
+
+    def __init__(self, num_atoms, board_size=BOARD_SIZE, seed=None, margin=0,
+                 min_spacing=1, accept=None):
+        """
+        initialize a generator
+        :param num_atoms: atoms in each layout
+        :param board_size: squares along one side of the board, rim included
+        :param seed: seed for the layouts drawn, None for a random one.
+        Single layouts and batches are drawn from separate streams, each the
+        same for the same seed
+        :param margin: interior rows and columns next to the rim kept free
+        of atoms, 1 stops the reflections an atom next to the rim gives
+        :param min_spacing: smallest king move distance between two atoms, 2
+        keeps atoms from touching, diagonals included
+        :param accept: function given an N x num_atoms array of sorted
+        square numbers returning N booleans, True for layouts to keep, or
+        None
+        """
+        inner = board_size - 2
+        self._num_atoms = num_atoms
+        self._board_size = board_size
+        self._min_spacing = min_spacing
+        self._accept = accept
+        self._squares = [row * inner + column
+                         for row in range(margin, inner - margin)
+                         for column in range(margin, inner - margin)]
+        if num_atoms > len(self._squares):
+            raise ValueError("%d atoms do not fit in %d allowed squares"
+                             % (num_atoms, len(self._squares)))
+        self._rng = Random(seed)
+        self._seed = seed
+        self._np_rng = None
+        # layouts from the last batch not handed out yet, last one first
+        self._accepted = []
+
+    def get_num_atoms(self):
+        """return atoms in each layout"""
+        return self._num_atoms
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board_size
+
+    def is_spaced(self, squares):
+        """returns True if no two of the square numbers are too close"""
+        inner = self._board_size - 2
+        for num, first in enumerate(squares):
+            for second in squares[num + 1:]:
+                if max(abs(first // inner - second // inner),
+                       abs(first % inner - second % inner)) < \
+                        self._min_spacing:
+                    return False
+        return True
+
+    def next_layout(self):
+        """return a sorted list of atom tuples that passes the filters"""
+        if self._accept is not None:
+            if not self._accepted:
+                self._accepted = squares_to_atoms(
+                    self.batch_squares(ACCEPT_BATCH), self._board_size)
+                self._accepted.reverse()
+            return self._accepted.pop()
+        for draw in range(MAX_REJECTED):
+            squares = sorted(self._rng.sample(self._squares,
+                                              self._num_atoms))
+            if self.is_spaced(squares):
+                return squares_to_atoms([squares], self._board_size)[0]
+        raise ValueError("no layout passes the filters")
+
+    def layouts(self, count=None):
+        """
+        yields layouts one at a time
+        :param count: layouts to make, None to go on for ever
+        """
+        made = 0
+        while count is None or made < count:
+            yield self.next_layout()
+            made += 1
+
+    def draw_squares(self, count):
+        """
+        samples count layouts with Floyd's algorithm: the i-th atom is drawn
+        from the first m - k + i + 1 allowed squares and takes the last of
+        them if it lands on one already chosen, which gives every set of
+        squares the same chance.  Filters are not applied
+        :return: count x num_atoms array of sorted square numbers
+        """
+        import numpy as np
+
+        if self._np_rng is None:
+            self._np_rng = np.random.default_rng(self._seed)
+        allowed = np.array(self._squares,
+                           dtype=np.min_scalar_type(self._squares[-1]))
+        num_allowed = len(allowed)
+        chosen = np.empty((count, self._num_atoms), dtype=np.intp)
+        for num, top in enumerate(range(num_allowed - self._num_atoms,
+                                        num_allowed)):
+            draw = self._np_rng.integers(0, top + 1, count)
+            taken = (chosen[:, :num] == draw[:, None]).any(axis=1)
+            chosen[:, num] = np.where(taken, top, draw)
+        squares = allowed[chosen]
+        squares.sort(axis=1)
+        return squares
+
+    def keep(self, squares):
+        """return the boolean array of layouts that pass the filters"""
+        import numpy as np
+
+        kept = np.ones(len(squares), dtype=bool)
+        if self._min_spacing > 1:
+            inner = self._board_size - 2
+            rows = squares // inner
+            columns = squares % inner
+            for first in range(self._num_atoms):
+                for second in range(first + 1, self._num_atoms):
+                    apart = np.maximum(
+                        np.abs(rows[:, first].astype(np.int32) -
+                               rows[:, second]),
+                        np.abs(columns[:, first].astype(np.int32) -
+                               columns[:, second]))
+                    kept &= apart >= self._min_spacing
+        if self._accept is not None:
+            kept &= np.asarray(self._accept(squares), dtype=bool)
+        return kept
+
+    def batch_squares(self, count):
+        """
+        draws layouts as an array
+        :param count: layouts to draw
+        :return: count x num_atoms array of sorted square numbers, the
+        smallest unsigned type that holds them
+        """
+        import numpy as np
+
+        batches = []
+        found = drawn = 0
+        while found < count:
+            # draw enough for what is missing at the share kept so far
+            share = found / drawn if found else 1.0
+            size = min(max(int((count - found) / share * 1.1) + 16, 1024),
+                       1 << 22)
+            squares = self.draw_squares(size)
+            squares = squares[self.keep(squares)]
+            batches.append(squares)
+            found += len(squares)
+            drawn += size
+            if not found and drawn >= MAX_REJECTED:
+                raise ValueError("no layout passes the filters")
+        return np.concatenate(batches)[:count]
+
+    def batch_masks(self, count):
+        """
+        draws layouts as interior masks, the form layouts_from_masks,
+        SignatureIndex and BitBoard.from_mask take
+        :param count: layouts to draw
+        :return: count uint64 masks
+        """
+        inner = self._board_size - 2
+        if inner * inner > 64:
+            raise ValueError("masks only hold boards of 64 interior squares")
+        return masks_from_squares(self.batch_squares(count))
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import time
+from random import Random
+
+from board_geometry import BOARD_SIZE, edge_cells
+
+
+def percentile(sorted_values, share):
+    """return the value share of the way through a sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(share * len(sorted_values)))]
+
+
+async def open_session(connect, num_atoms, opening):
+    """
+    connects and starts a game
+    :param connect: coroutine function returning a reader, writer pair
+    :param num_atoms: atoms in the game
+    :param opening: semaphore limiting connections being opened at once
+    :return: reader, writer
+    """
+    async with opening:
+        reader, writer = await connect()
+        writer.write(b"NEW %d\n" % num_atoms)
+        await writer.drain()
+        await reader.readline()
+    return reader, writer
+
+
+async def play_session(reader, writer, num_requests, rng, latencies,
+                       think_time=0.0, board_size=BOARD_SIZE):
+    """
+    sends random requests one at a time and times each reply
+    :param reader: connection's StreamReader
+    :param writer: connection's StreamWriter
+    :param num_requests: requests to send
+    :param rng: Random for the requests
+    :param latencies: list the request times in seconds are added to
+    :param think_time: mean seconds a player waits between requests
+    :param board_size: squares along one side of the board, rim included
+    """
+    edges = edge_cells(board_size)
+    inner = board_size - 2
+    for request in range(num_requests):
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+        roll = rng.random()
+        if roll < 0.6:
+            line = b"SHOOT %d %d\n" % rng.choice(edges)
+        elif roll < 0.9:
+            line = b"GUESS %d %d\n" % (rng.randint(1, inner),
+                                       rng.randint(1, inner))
+        else:
+            line = b"SCORE\n"
+        start = time.perf_counter()
+        writer.write(line)
+        await writer.drain()
+        await reader.readline()
+        latencies.append(time.perf_counter() - start)
+    writer.write(b"QUIT\n")
+    await writer.drain()
+    await reader.readline()
+    writer.close()
+
+
+async def run_load_test(num_sessions=10000, num_requests=20, num_atoms=4,
+                        host="127.0.0.1", port=8765, path=None, seed=0,
+                        think_time=0.0, max_opening=500):
+    """
+    holds num_sessions games open at once, then plays them all together
+    :param num_sessions: concurrent sessions
+    :param num_requests: requests each session sends once all are open
+    :param num_atoms: atoms in each game
+    :param host: server address for TCP
+    :param port: server port for TCP
+    :param path: server Unix socket path instead of TCP, or None
+    :param seed: seed for the requests
+    :param think_time: mean seconds a session waits between requests, 0
+    sends the next request as soon as the reply is in
+    :param max_opening: connections being opened at once
+    :return: dictionary of sessions, requests, p50 and p99 latency in ms
+    and requests per second
+    """
+    if path is not None:
+        def connect():
+            return asyncio.open_unix_connection(path)
+    else:
+        def connect():
+            return asyncio.open_connection(host, port)
+
+    opening = asyncio.Semaphore(max_opening)
+    sessions = await asyncio.gather(*[
+        open_session(connect, num_atoms, opening)
+        for session in range(num_sessions)])
+
+    rng = Random(seed)
+    latencies = []
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        play_session(reader, writer, num_requests, Random(rng.random()),
+                     latencies, think_time)
+        for reader, writer in sessions])
+    seconds = time.perf_counter() - start
+
+    latencies.sort()
+    return {"sessions": num_sessions,
+            "requests": len(latencies),
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "requests_per_second": len(latencies) / seconds}
+
+
+def main():
+    """command line load test against a running server.py"""
+    parser = argparse.ArgumentParser(
+        description="time requests against many open Blackbox sessions")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None,
+                        help="Unix socket path of the server instead of TCP")
+    parser.add_argument("--sessions", type=int, default=10000)
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--think-ms", type=float, default=0.0,
+                        help="mean pause between a session's requests")
+    args = parser.parse_args()
+    report = asyncio.run(run_load_test(args.sessions, args.requests,
+                                       args.atoms, args.host, args.port,
+                                       args.unix, args.seed,
+                                       args.think_ms / 1000))
+    for name, value in report.items():
+        print("%s: %s" % (name, value))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+import json
+from collections import deque
+from functools import wraps
+from time import perf_counter
+
+# seconds of work a frame may take at the clock.tick(60) cap
+FRAME_BUDGET = 1 / 60
+
+
+def percentile(sorted_values, share):
+    """return the value share of the way through a sorted list"""
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1,
+                             int(share * len(sorted_values)))]
+
+
+class Profiler:
+    """
+    class to time the main loop phases and game rules while the game runs.
+    Timed functions are registered as targets and only wrapped while the
+    profiler is on; turning it off puts the original functions back, so an
+    idle profiler costs nothing but one end_frame call a frame.  Times are
+    kept as rolling windows of recent calls plus a bounded list of trace
+    events that export_trace writes in the Chrome trace format, which
+    chrome://tracing, Perfetto and speedscope open
+    """
+
+    _shared = None
+
+    @classmethod
+    def shared(cls):
+        """return the profiler shared by the whole game"""
+        if cls._shared is None:
+            cls._shared = cls()
+        return cls._shared
+
+    def __init__(self, window=600, max_events=100000, budget=FRAME_BUDGET):
+        """
+        initialize a profiler that is off
+        :param window: most recent calls of each target and frames kept
+        :param max_events: most recent trace events kept for export
+        :param budget: seconds of work before a frame counts as dropped
+        """
+        self._window = window
+        self._budget = budget
+        self._enabled = False
+        # (owner, attribute name, label) of everything that can be timed
+        self._targets = []
+        self._originals = {}
+        self._samples = {}
+        self._calls = {}
+        self._frames = deque(maxlen=window)
+        self._num_frames = 0
+        self._num_dropped = 0
+        self._events = deque(maxlen=max_events)
+        self._depth = 0
+        self._frame_busy = 0.0
+        self._origin = perf_counter()
+
+    def add_target(self, owner, name, label=None):
+        """
+        registers a function to time while the profiler is on
+        :param owner: class or module holding the function
+        :param name: attribute name of the function
+        :param label: name shown for it, owner.name if None
+        """
+        if label is None:
+            label = "%s.%s" % (owner.__name__, name)
+        self._targets.append((owner, name, label))
+        if self._enabled:
+            self.install(owner, name, label)
+
+    def install(self, owner, name, label):
+        """swaps a timed wrapper in for a target"""
+        original = vars(owner)[name]
+        self._originals[owner, name] = original
+        setattr(owner, name, self.wrap(original, label))
+
+    def wrap(self, function, label):
+        """return function wrapped to record every call under label"""
+        profiler = self
+
+        @wraps(function)
+        def timed(*args, **kwargs):
+            profiler._depth += 1
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds = perf_counter() - start
+                profiler._depth -= 1
+                profiler.record(label, start, seconds)
+        return timed
+
+    def is_enabled(self):
+        """return True while targets are being timed"""
+        return self._enabled
+
+    def enable(self):
+        """starts timing every target"""
+        if not self._enabled:
+            self._enabled = True
+            self._frame_busy = 0.0
+            for owner, name, label in self._targets:
+                self.install(owner, name, label)
+
+    def disable(self):
+        """stops timing and puts the original functions back"""
+        if self._enabled:
+            self._enabled = False
+            for (owner, name), original in self._originals.items():
+                setattr(owner, name, original)
+            self._originals = {}
+
+    def toggle(self):
+        """turns the profiler on if it is off and off if it is on"""
+        if self._enabled:
+            self.disable()
+        else:
+            self.enable()
+
+    def record(self, label, start, seconds):
+        """
+        adds one timed call
+        :param label: name of what was timed
+        :param start: perf_counter() at the start of the call
+        :param seconds: time the call took
+        """
+        samples = self._samples.get(label)
+        if samples is None:
+            samples = self._samples[label] = deque(maxlen=self._window)
+            self._calls[label] = 0
+        samples.append(seconds)
+        self._calls[label] += 1
+        self._events.append((label, start, seconds, self._depth))
+        # calls inside other timed calls are already in their caller's time
+        if self._depth == 0:
+            self._frame_busy += seconds
+
+    def end_frame(self):
+        """
+        closes a frame: the time of the outermost calls timed since the last
+        frame is its work, idle waits left out
+        """
+        if not self._enabled:
+            return
+        self._frames.append(self._frame_busy)
+        self._num_frames += 1
+        if self._frame_busy > self._budget:
+            self._num_dropped += 1
+        self._events.append(("frame", perf_counter(), self._frame_busy, -1))
+        self._frame_busy = 0.0
+
+    def get_num_dropped(self):
+        """return frames whose work went over the budget since the start"""
+        return self._num_dropped
+
+    def summary(self):
+        """
+        works out the rolling statistics
+        :return: dictionary of label, with "frame" for whole frames, to a
+        dictionary of calls, mean_ms, p50_ms, p99_ms and max_ms over the
+        window.  The frame entry also has dropped, the frames in the window
+        over the budget, and window, the frames in the window
+        """
+        windows = dict(self._samples)
+        windows["frame"] = self._frames
+        calls = dict(self._calls)
+        calls["frame"] = self._num_frames
+        stats = {}
+        for label, samples in windows.items():
+            ordered = sorted(samples)
+            stats[label] = {
+                "calls": calls[label],
+                "mean_ms": sum(ordered) / len(ordered) * 1000
+                if ordered else 0.0,
+                "p50_ms": percentile(ordered, 0.50) * 1000,
+                "p99_ms": percentile(ordered, 0.99) * 1000,
+                "max_ms": ordered[-1] * 1000 if ordered else 0.0}
+        stats["frame"]["window"] = len(self._frames)
+        stats["frame"]["dropped"] = sum(busy > self._budget
+                                        for busy in self._frames)
+        return stats
+
+    def histogram(self, label, bucket_ms=1.0, num_buckets=20):
+        """
+        counts a target's recent times into equal buckets
+        :param label: name of what was timed, "frame" for whole frames
+        :param bucket_ms: width of a bucket
+        :param num_buckets: buckets, the last one also holds everything
+        slower
+        :return: list of counts, fastest bucket first
+        """
+        samples = self._frames if label == "frame" else \
+            self._samples.get(label, ())
+        counts = [0] * num_buckets
+        for seconds in samples:
+            counts[min(num_buckets - 1,
+                       int(seconds * 1000 / bucket_ms))] += 1
+        return counts
+
+    def export_trace(self, path):
+        """
+        writes the kept trace events as a Chrome trace JSON file
+        :param path: file to write
+        """
+        events = []
+        for label, start, seconds, depth in self._events:
+            time_us = (start - self._origin) * 1e6
+            if depth < 0:
+                # frames are a counter track of their work in ms
+                events.append({"name": "frame work ms", "ph": "C",
+                               "ts": time_us, "pid": 0,
+                               "args": {"ms": seconds * 1000}})
+            else:
+                events.append({"name": label, "ph": "X", "ts": time_us,
+                               "dur": seconds * 1e6, "pid": 0, "tid": 0})
+        with open(path, "w") as trace:
+            json.dump({"traceEvents": events,
+                       "displayTimeUnit": "ms",
+                       "otherData": {"summary": self.summary()}}, trace)
@@ -0,0 +1,63 @@
+from bit_board import BitBoard, TABLE_SIZE_LIMIT
+from board_geometry import BOARD_SIZE, edge_cells
+from layouts import LayoutGenerator
+from solver import LayoutSolver
+
+
+class PuzzleGenerator:
+    """
+    class to draw random atom layouts that only one layout can explain, so
+    a careful player can always deduce the answer.  With a SignatureIndex
+    each candidate is checked by a lookup, without one the LayoutSolver
+    checks it from all the edge rays, about a millisecond each.  Boards
+    over TABLE_SIZE_LIMIT are too big to check, any layout is given there
+    """
+
+    def __init__(self, num_atoms, board_size=BOARD_SIZE, seed=None,
+                 index=None, layouts=None):
+        """
+        initialize a generator
+        :param num_atoms: atoms in each puzzle
+        :param board_size: squares along one side of the board, rim included
+        :param seed: seed for the puzzles drawn, None for a random one
+        :param index: SignatureIndex for num_atoms or a SignatureDatabase,
+        None to use the solver
+        :param layouts: LayoutGenerator to draw candidates from, for filters
+        such as keeping atoms off the rim, None for any layout
+        """
+        self._num_atoms = num_atoms
+        self._board_size = board_size
+        self._index = index
+        if layouts is None:
+            layouts = LayoutGenerator(num_atoms, board_size, seed)
+        self._layouts = layouts
+
+    def is_unique(self, list_atoms):
+        """returns True if no other layout gives the same ray results"""
+        board = BitBoard(list_atoms, self._board_size)
+        if self._index is not None:
+            return self._index.is_unique(board.get_mask())
+        solver = LayoutSolver(len(list_atoms), self._board_size)
+        for edge in edge_cells(self._board_size):
+            solver.add_shot(edge, board.trace(*edge))
+        return solver.count() == 1
+
+    def next_puzzle(self):
+        """return a sorted list of atom tuples that has a unique solution"""
+        if self._board_size > TABLE_SIZE_LIMIT:
+            # BitBoard and the solver would build tables nobody can wait for
+            return self._layouts.next_layout()
+        while True:
+            list_atoms = self._layouts.next_layout()
+            if self.is_unique(list_atoms):
+                return list_atoms
+
+    def puzzles(self, count=None):
+        """
+        yields puzzles one at a time
+        :param count: puzzles to make, None to go on for ever
+        """
+        made = 0
+        while count is None or made < count:
+            yield self.next_puzzle()
+            made += 1
@@ -0,0 +1,334 @@
+import argparse
+import atexit
+import os
+import struct
+import time
+
+from Game_pieces import Player
+from board_geometry import decode_outcome, encode_outcome
+
+MAGIC = b"BBXLOG01"
+# kind, three small fields and a signed score change.  Every record is the
+# same size, so a file can be read as one array without parsing it
+RECORD = struct.Struct("<BBBBb")
+# GAME: atoms, board size, -, starting points
+GAME = 0
+# ATOM: row, column of one atom of the game's layout
+ATOM = 1
+# SHOT: entry row, entry column, outcome code, points taken off
+SHOT = 2
+# GUESS: row, column, GUESS_* flags, points taken off
+GUESS = 3
+GUESS_CORRECT = 1
+GUESS_REPEATED = 2
+# outcome codes have to fit a byte
+LOG_SIZE_LIMIT = 64
+# the atom count of a GAME record is one byte
+LOG_ATOM_LIMIT = 255
+# moves between the states a GameReplay keeps
+SNAPSHOT_EVERY = 16
+
+
+def can_log(list_atoms, board_size):
+    """returns True if a game fits the record format"""
+    return board_size <= LOG_SIZE_LIMIT and len(list_atoms) <= LOG_ATOM_LIMIT
+
+
+class ReplayWriter:
+    """
+    class to append games to a replay log as they are played.  Records
+    collect in memory and go to the file in batches of whole games, so
+    logging a move costs one struct.pack and writers in several processes
+    can share a file.  A writer records one game at a time
+    """
+
+    def __init__(self, path, flush_bytes=65536):
+        """
+        opens a log for appending, starting it if it is new
+        :param path: file to append to
+        :param flush_bytes: bytes held in memory before the games in them
+        are written
+        """
+        self._flush_bytes = flush_bytes
+        self._buffer = bytearray()
+        self._board_size = None
+        # batches are written in one call each, so no second buffer
+        self._file = open(path, "ab", buffering=0)
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(MAGIC)
+        else:
+            with open(path, "rb") as existing:
+                magic = existing.read(len(MAGIC))
+            if magic != MAGIC:
+                self._file.close()
+                raise ValueError("%s is not a replay log" % path)
+            # a record cut short by a crash would shift every record after it
+            self._file.truncate(size - (size - len(MAGIC)) % RECORD.size)
+        # records still in memory are written however the program ends
+        atexit.register(self.close)
+
+    def add(self, kind, first, second, third=0, points=0):
+        """adds one record to the batch"""
+        self._buffer += RECORD.pack(kind, first, second, third, points)
+
+    def start_game(self, list_atoms, board_size, points):
+        """
+        starts the records of a new game
+        :param list_atoms: list of (row, column) atom tuples
+        :param board_size: squares along one side of the board, rim included
+        :param points: points the player starts with
+        """
+        if not can_log(list_atoms, board_size):
+            raise ValueError("only boards of up to %d squares and %d atoms "
+                             "are logged" % (LOG_SIZE_LIMIT, LOG_ATOM_LIMIT))
+        if len(self._buffer) >= self._flush_bytes:
+            self.flush()
+        self._board_size = board_size
+        self.add(GAME, len(list_atoms), board_size, 0, points)
+        for row, column in list_atoms:
+            self.add(ATOM, row, column)
+
+    def add_shot(self, entry, result, points):
+        """
+        records a ray
+        :param entry: entry tuple
+        :param result: find_exit result
+        :param points: points it took off the score
+        """
+        self.add(SHOT, entry[0], entry[1],
+                 encode_outcome(result, self._board_size), -points)
+
+    def add_guess(self, guess, correct, is_new, points):
+        """
+        records an atom guess
+        :param guess: square tuple
+        :param correct: True if an atom was there
+        :param is_new: False if the square had been guessed before
+        :param points: points it took off the score
+        """
+        flags = (GUESS_CORRECT if correct else 0) | \
+            (0 if is_new else GUESS_REPEATED)
+        self.add(GUESS, guess[0], guess[1], flags, -points)
+
+    def flush(self):
+        """writes the records held in memory"""
+        if self._buffer:
+            self._file.write(self._buffer)
+            self._buffer.clear()
+
+    def close(self):
+        """writes what is left and closes the file"""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def read_records(path):
+    """
+    maps a replay log as an array of records.  A record cut short at the
+    end, from a game still being written, is left out
+    :param path: replay log
+    :return: numpy structured array with kind, first, second, third and
+    points fields
+    """
+    import numpy as np
+
+    with open(path, "rb") as log:
+        if log.read(len(MAGIC)) != MAGIC:
+            raise ValueError("%s is not a replay log" % path)
+    count = (os.path.getsize(path) - len(MAGIC)) // RECORD.size
+    dtype = np.dtype([("kind", np.uint8), ("first", np.uint8),
+                      ("second", np.uint8), ("third", np.uint8),
+                      ("points", np.int8)])
+    if count == 0:
+        return np.zeros(0, dtype)
+    return np.memmap(path, dtype, "r", len(MAGIC), (count,))
+
+
+def summarize_games(records):
+    """
+    works out how every game in a log went without stepping through it
+    :param records: array from read_records
+    :return: dictionary of per game arrays: atoms, points, shots, guesses,
+    found and won
+    """
+    import numpy as np
+
+    kinds = records["kind"]
+    is_game = kinds == GAME
+    num_games = int(np.count_nonzero(is_game))
+    game = np.cumsum(is_game) - 1
+
+    def per_game(selected, weights=None):
+        return np.bincount(game[selected], weights, minlength=num_games)
+
+    every = game >= 0
+    points = per_game(every, records["points"][every].astype(np.int64))
+    is_shot = kinds == SHOT
+    is_guess = kinds == GUESS
+    flags = records["third"]
+    found = per_game(is_guess & (flags == GUESS_CORRECT))
+    atoms = records["first"][is_game]
+    return {"atoms": atoms,
+            "points": points.astype(np.int64),
+            "shots": per_game(is_shot),
+            "guesses": per_game(is_guess),
+            "found": found,
+            "won": (found == atoms) & (points > 0)}
+
+
+class GameReplay:
+    """
+    class to step through one logged game.  The player's state is kept
+    every SNAPSHOT_EVERY moves as it is read, so the state after any move
+    is a snapshot plus at most SNAPSHOT_EVERY - 1 moves
+    """
+
+    def __init__(self, records, snapshot_every=SNAPSHOT_EVERY):
+        """
+        reads a game and keeps its snapshots
+        :param records: records of one game, its GAME record first
+        :param snapshot_every: moves between kept states
+        """
+        header = records[0]
+        if header["kind"] != GAME:
+            raise ValueError("records do not start with a game")
+        num_atoms = int(header["first"])
+        self._board_size = int(header["second"])
+        self._atoms = [(row, column) for kind, row, column, third, points
+                       in records[1:num_atoms + 1].tolist()]
+        self._moves = records[num_atoms + 1:].tolist()
+        self._snapshot_every = snapshot_every
+
+        player = Player(self._board_size)
+        points, atoms_left = int(header["points"]), num_atoms
+        self._snapshots = []
+        for num, move in enumerate(self._moves):
+            if num % snapshot_every == 0:
+                self._snapshots.append((player.copy(), points, atoms_left))
+            points, atoms_left = self.apply(player, move, points, atoms_left)
+        if len(self._moves) % snapshot_every == 0:
+            self._snapshots.append((player, points, atoms_left))
+
+    def get_atoms(self):
+        """return list of (row, column) atom tuples"""
+        return self._atoms
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board_size
+
+    def get_num_moves(self):
+        """return shots and guesses in the game"""
+        return len(self._moves)
+
+    def get_move(self, num):
+        """
+        returns one move
+        :param num: move number, from 0
+        :return: (SHOT, entry tuple, find_exit result) or
+        (GUESS, square tuple, True if an atom was there)
+        """
+        kind, row, column, third, points = self._moves[num]
+        if kind == SHOT:
+            return SHOT, (row, column), decode_outcome(third,
+                                                       self._board_size)
+        return GUESS, (row, column), bool(third & GUESS_CORRECT)
+
+    def apply(self, player, move, points, atoms_left):
+        """
+        plays one record onto a Player
+        :return: points, atoms left afterwards
+        """
+        kind, row, column, third, change = move
+        if kind == SHOT:
+            player.add_entry_exit((row, column),
+                                  decode_outcome(third, self._board_size))
+        elif player.add_atom_guess((row, column), third & GUESS_CORRECT) \
+                and third & GUESS_CORRECT:
+            atoms_left -= 1
+        return points + change, atoms_left
+
+    def state_at(self, num_moves):
+        """
+        finds the state of the game after its first num_moves moves
+        :param num_moves: moves played, 0 to get_num_moves()
+        :return: Player, points, atoms left
+        """
+        if not 0 <= num_moves <= len(self._moves):
+            raise IndexError("game has %d moves" % len(self._moves))
+        snapshot = num_moves // self._snapshot_every
+        player, points, atoms_left = self._snapshots[snapshot]
+        player = player.copy()
+        for move in self._moves[snapshot * self._snapshot_every:num_moves]:
+            points, atoms_left = self.apply(player, move, points, atoms_left)
+        return player, points, atoms_left
+
+
+class ReplayReader:
+    """class to find the games in a replay log and open them for stepping"""
+
+    def __init__(self, path):
+        """
+        maps the log and finds where each game starts
+        :param path: replay log
+        """
+        import numpy as np
+
+        self._records = read_records(path)
+        self._starts = np.flatnonzero(self._records["kind"] == GAME)
+
+    def get_num_games(self):
+        """return games in the log"""
+        return len(self._starts)
+
+    def get_records(self):
+        """return the array of every record in the log"""
+        return self._records
+
+    def game(self, num):
+        """return a GameReplay of game num, from 0"""
+        start = self._starts[num]
+        stop = self._starts[num + 1] if num + 1 < len(self._starts) \
+            else len(self._records)
+        return GameReplay(self._records[start:stop])
+
+
+def main():
+    """command line summary of a replay log"""
+    parser = argparse.ArgumentParser(
+        description="summarize the games in a Blackbox replay log")
+    parser.add_argument("path", nargs="?", default="replays.bbxlog")
+    parser.add_argument("--game", type=int, default=None,
+                        help="also show the state of this game")
+    parser.add_argument("--move", type=int, default=None,
+                        help="moves into --game to show, all if left out")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    reader = ReplayReader(args.path)
+    summary = summarize_games(reader.get_records())
+    seconds = time.perf_counter() - start
+    num_games = reader.get_num_games()
+    print("games: %d" % num_games)
+    if num_games:
+        print("win_rate: %.4f" % summary["won"].mean())
+        print("mean_score: %.3f" % summary["points"].mean())
+        print("mean_shots: %.3f" % summary["shots"].mean())
+        print("mean_guesses: %.3f" % summary["guesses"].mean())
+    print("games scanned per second: %.0f" % (num_games / seconds))
+
+    if args.game is not None:
+        replay = reader.game(args.game)
+        num_moves = replay.get_num_moves() if args.move is None else args.move
+        player, points, atoms_left = replay.state_at(num_moves)
+        print("atoms: %s" % replay.get_atoms())
+        print("after %d of %d moves: %d points, %d atoms left" % (
+            num_moves, replay.get_num_moves(), points, atoms_left))
+        print("moves: %s" % player.get_moves())
+        print("guesses: %s" % player.get_atom_guesses())
+
+
+if __name__ == '__main__':
+    main()
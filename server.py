@@ -0,0 +1,195 @@
+import argparse
+import asyncio
+import gc
+from random import Random
+
+from board_geometry import BOARD_SIZE
+from engine import GameEngine
+
+# longest request line read, longer ones close the connection
+LINE_LIMIT = 256
+# allocations between young collections, and young collections between
+# older ones.  The defaults walked every live session many times a second
+# while thousands of them were open
+GC_THRESHOLDS = (20000, 20, 20)
+
+
+class GameServer:
+    """
+    class to host many Blackbox games at once over a line protocol, one
+    game per connection.  Every request is answered from the game rules in
+    microseconds, so nothing waits on anything but the sockets.  Requests:
+
+    NEW <atoms>      start a game          OK <atoms>
+    SHOOT <row> <col>                      HIT, REFLECT, EXIT <row> <col>,
+                                           BAD or OVER
+    GUESS <row> <col>                      ATOM, MISS or OVER
+    SCORE                                  SCORE <points> <atoms left>
+                                           <playing|won|lost>
+    QUIT                                   BYE
+
+    Anything else gets ERR and a reason
+    """
+
+    def __init__(self, max_sessions=20000, board_size=BOARD_SIZE, seed=None):
+        """
+        initialize a server with no sessions
+        :param max_sessions: connections served at once, more are turned away
+        :param board_size: squares along one side of the board, rim included
+        :param seed: seed for the atom layouts, None for a random one
+        """
+        self._max_sessions = max_sessions
+        self._board_size = board_size
+        self._rng = Random(seed)
+        inner = board_size - 2
+        self._squares = [(row, column) for row in range(1, inner + 1)
+                         for column in range(1, inner + 1)]
+        self._num_sessions = 0
+        self._num_requests = 0
+
+    def get_num_sessions(self):
+        """return connections being served"""
+        return self._num_sessions
+
+    def new_game(self, num_atoms):
+        """return a GameEngine over num_atoms random atoms"""
+        return GameEngine(self._rng.sample(self._squares, num_atoms),
+                          self._board_size)
+
+    def handle_line(self, engine, line):
+        """
+        answers one request
+        :param engine: the connection's GameEngine, None before NEW
+        :param line: request without its line end
+        :return: the connection's GameEngine afterwards, reply line
+        """
+        words = line.split()
+        if not words:
+            return engine, "ERR empty request"
+        command, args = words[0].upper(), words[1:]
+        try:
+            numbers = [int(arg) for arg in args]
+        except ValueError:
+            return engine, "ERR arguments must be numbers"
+
+        if command == "NEW":
+            inner = self._board_size - 2
+            if len(numbers) != 1 or not 0 < numbers[0] <= inner * inner:
+                return engine, "ERR NEW takes an atom count"
+            return self.new_game(numbers[0]), "OK %d" % numbers[0]
+        elif command == "QUIT":
+            return engine, "BYE"
+        elif command not in ("SHOOT", "GUESS", "SCORE"):
+            return engine, "ERR unknown command"
+        elif engine is None:
+            return engine, "ERR no game, send NEW first"
+        elif command == "SCORE":
+            status = "won" if engine.is_won() else \
+                "lost" if engine.is_lost() else "playing"
+            return engine, "SCORE %d %d %s" % (
+                engine.get_score(), engine.get_num_atoms_left(), status)
+        elif len(numbers) != 2:
+            return engine, "ERR %s takes a row and a column" % command
+        elif command == "SHOOT":
+            return engine, self.shoot_reply(engine.shoot_ray(*numbers))
+        elif not all(0 <= number < self._board_size for number in numbers):
+            return engine, "ERR square is not on the board"
+        elif not all(0 < number < self._board_size - 1
+                     for number in numbers):
+            # the rim never holds an atom, as in the window's check_click
+            return engine, "ERR square is on the rim"
+        correct = engine.guess_atom(*numbers)
+        if correct is None:
+            return engine, "OVER"
+        return engine, "ATOM" if correct else "MISS"
+
+    def shoot_reply(self, result):
+        """return the reply line for a GameEngine.shoot_ray result"""
+        if result is None:
+            return "OVER"
+        elif result == "Bad shot":
+            return "BAD"
+        elif result == "Hit":
+            return "HIT"
+        elif result == "reflect":
+            return "REFLECT"
+        return "EXIT %d %d" % result
+
+    async def handle_connection(self, reader, writer):
+        """serves one connection's game until it quits or goes away"""
+        if self._num_sessions >= self._max_sessions:
+            writer.write(b"ERR server full\n")
+            writer.close()
+            return
+        self._num_sessions += 1
+        engine = None
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (asyncio.LimitOverrunError, ValueError):
+                    # a line over LINE_LIMIT ends the connection
+                    break
+                if not line:
+                    break
+                engine, reply = self.handle_line(
+                    engine, line.decode("ascii", "replace").strip())
+                self._num_requests += 1
+                writer.write(reply.encode() + b"\n")
+                # a client that does not read its replies stops being read
+                await writer.drain()
+                if reply == "BYE":
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            self._num_sessions -= 1
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8765, path=None,
+                    backlog=4096):
+        """
+        serves until cancelled
+        :param host: address to listen on for TCP
+        :param port: port to listen on for TCP
+        :param path: Unix socket path to listen on instead of TCP, or None
+        :param backlog: connections the OS queues before they are accepted
+        """
+        # what is loaded before the first connection lives as long as the
+        # server, so full collections stop walking it.  Sessions are left
+        # to the collector: asyncio streams and tasks hold reference cycles,
+        # and a frozen cycle would never be freed
+        gc.freeze()
+        gc.set_threshold(*GC_THRESHOLDS)
+        if path is not None:
+            server = await asyncio.start_unix_server(
+                self.handle_connection, path, limit=LINE_LIMIT,
+                backlog=backlog)
+        else:
+            server = await asyncio.start_server(
+                self.handle_connection, host, port, limit=LINE_LIMIT,
+                backlog=backlog)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    """command line start of the server"""
+    parser = argparse.ArgumentParser(
+        description="host Blackbox games over a line protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", default=None,
+                        help="Unix socket path to listen on instead of TCP")
+    parser.add_argument("--max-sessions", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+    server = GameServer(args.max_sessions, seed=args.seed)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
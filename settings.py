@@ -1,4 +1,4 @@
-from pygame import font
+import os
 
 
 class Settings():
@@ -11,17 +11,35 @@ class Settings():
         self.screen_height = 700
         self.bg_color = (230, 230, 230)
         self.line_color = (0, 0, 0)
+        # squares along one side of the board, rim included
+        self.board_size = 10
         self.square_width = 70
         self.square_height = 70
         self.margin = 10
-        self.font = font.SysFont(None, 24)
+        # fonts are made on first use by Graphics_classes.FontRegistry, so
+        # the settings and game rules never load pygame
+        self.font_name = None
+        self.font_size = 24
+        # where the font files found for font names are kept between runs
+        self.font_cache_path = os.path.join(os.path.expanduser("~"),
+                                            ".blackbox_fonts.json")
         self.text_color = (30, 30, 30)
+        # every game played is appended here, see replay_log.py
+        self.replay_path = "replays.bbxlog"
+        # F3 turns timing on and off, F4 writes what was timed here
+        self.profile_path = "blackbox_profile.json"
+        # F2 shades every square by the chance of an atom on it
+        self.heatmap_low_color = (40, 90, 230)
+        self.heatmap_high_color = (230, 40, 40)
+        self.heatmap_alpha = 170
 
 
 class GameStats():
     """Track statistics for Blackbox game"""
 
-    def __init__(self, bb_settings):
+    __slots__ = ('_bb_settings', '_game_active', '_points', '_atom_left')
+
+    def __init__(self, bb_settings=None):
         """Initialize statistics."""
         self._bb_settings = bb_settings
         self._game_active = "Start_game"
@@ -0,0 +1,226 @@
+import argparse
+import mmap
+import struct
+from math import comb
+from multiprocessing import Pool
+
+import numpy as np
+from batch_tracer import layouts_from_masks, trace_batch
+from board_geometry import BOARD_SIZE, edge_cells, encode_outcome
+from signature_index import colex_masks, hash_signatures, layout_rank
+
+MAGIC = b"BBXSIG01"
+# magic, board size, edges per signature, most atoms in a layout
+HEADER = struct.Struct("<8sIII")
+# layouts and file offset of the section for one atom count
+SECTION = struct.Struct("<QQ")
+
+
+def padded(num_bytes):
+    """return num_bytes rounded up so the next array starts 8 byte aligned"""
+    return -(-num_bytes // 8) * 8
+
+
+def section_arrays(buffer, offset, count, num_edges):
+    """
+    views the four arrays of one atom count's section, all in layout rank
+    order except the index: masks, signatures, sorted signature hashes and
+    the rank of each sorted hash
+    :param buffer: mmap or memmap holding the file
+    :param offset: byte offset of the section
+    :param count: layouts in the section
+    :param num_edges: outcome codes per signature
+    :return: masks, signatures, hashes, order arrays sharing the buffer
+    """
+    masks = np.frombuffer(buffer, np.uint64, count, offset)
+    offset += 8 * count
+    signatures = np.frombuffer(buffer, np.uint8, count * num_edges,
+                               offset).reshape(count, num_edges)
+    offset += padded(count * num_edges)
+    hashes = np.frombuffer(buffer, np.uint64, count, offset)
+    offset += 8 * count
+    order = np.frombuffer(buffer, np.uint32, count, offset)
+    return masks, signatures, hashes, order
+
+
+def section_size(count, num_edges):
+    """return bytes taken by one atom count's section"""
+    return 8 * count + padded(count * num_edges) + 8 * count + \
+        padded(4 * count)
+
+
+def trace_task(task):
+    """worker side of build_database: traces one chunk of layouts"""
+    start, masks, board_size = task
+    return start, trace_batch(layouts_from_masks(masks, board_size))
+
+
+def build_database(path, max_atoms=5, board_size=BOARD_SIZE, workers=None,
+                   chunk_size=65536):
+    """
+    writes the signature of every layout of 1 to max_atoms atoms to a file.
+    Layouts are traced by a pool of worker processes, then each atom count
+    gets a hash index sorted in the parent
+    :param path: file to write
+    :param max_atoms: most atoms in a layout
+    :param board_size: squares along one side of the board, rim included
+    :param workers: processes to trace with, one per core if None
+    :param chunk_size: layouts handed to a worker at a time
+    """
+    num_edges = len(edge_cells(board_size))
+    inner = board_size - 2
+    counts = [comb(inner * inner, num_atoms)
+              for num_atoms in range(1, max_atoms + 1)]
+    offsets = []
+    size = padded(HEADER.size + SECTION.size * max_atoms)
+    for count in counts:
+        offsets.append(size)
+        size += section_size(count, num_edges)
+
+    with open(path, "wb") as out:
+        out.truncate(size)
+    data = np.memmap(path, dtype=np.uint8, mode="r+")
+    data[:HEADER.size] = np.frombuffer(
+        HEADER.pack(MAGIC, board_size, num_edges, max_atoms), np.uint8)
+    for num, (count, offset) in enumerate(zip(counts, offsets)):
+        start = HEADER.size + SECTION.size * num
+        data[start:start + SECTION.size] = np.frombuffer(
+            SECTION.pack(count, offset), np.uint8)
+
+    with Pool(workers) as pool:
+        for num_atoms, count, offset in zip(range(1, max_atoms + 1), counts,
+                                            offsets):
+            masks, signatures, hashes, order = section_arrays(
+                data, offset, count, num_edges)
+            masks[:] = colex_masks(inner * inner, num_atoms)
+            tasks = ((start, masks[start:start + chunk_size], board_size)
+                     for start in range(0, count, chunk_size))
+            for start, traced in pool.imap_unordered(trace_task, tasks):
+                signatures[start:start + len(traced)] = traced
+
+            all_hashes = np.concatenate([
+                hash_signatures(signatures[start:start + chunk_size])
+                for start in range(0, count, chunk_size)])
+            sorted_ranks = np.argsort(all_hashes, kind="stable")
+            hashes[:] = all_hashes[sorted_ranks]
+            order[:] = sorted_ranks
+    data.flush()
+    del data
+
+
+class SignatureDatabase:
+    """
+    class to query a file written by build_database.  The file is mapped,
+    not read, so opening it is instant and every process that opens it
+    shares the same pages of the OS file cache
+    """
+
+    def __init__(self, path):
+        """
+        maps the file and views its arrays
+        :param path: file written by build_database
+        """
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._board_size, self._num_edges, self._max_atoms = \
+            HEADER.unpack_from(self._map)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError("%s is not a signature database" % path)
+        self._edges = edge_cells(self._board_size)
+        self._sections = {}
+        for num in range(self._max_atoms):
+            count, offset = SECTION.unpack_from(
+                self._map, HEADER.size + SECTION.size * num)
+            self._sections[num + 1] = section_arrays(
+                self._map, offset, count, self._num_edges)
+
+    def close(self):
+        """unmaps the file"""
+        # views on the map have to go before it can be closed
+        self._sections = {}
+        self._map.close()
+        self._file.close()
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board_size
+
+    def get_max_atoms(self):
+        """return most atoms in a layout in the file"""
+        return self._max_atoms
+
+    def get_num_layouts(self, num_atoms):
+        """return layouts in the file with num_atoms atoms"""
+        return len(self._sections[num_atoms][0])
+
+    def get_signature(self, mask):
+        """
+        looks up the outcome code of every edge ray for a layout
+        :param mask: interior mask
+        :return: bytes of outcome codes in edge_cells order
+        """
+        signatures = self._sections[bin(mask).count("1")][1]
+        return signatures[layout_rank(mask)].tobytes()
+
+    def ranks_for(self, signature, num_atoms):
+        """return ranks of the layouts with num_atoms atoms and a signature"""
+        masks, signatures, hashes, order = self._sections[num_atoms]
+        row = np.frombuffer(bytes(signature), np.uint8)[None, :]
+        key = hash_signatures(row)[0]
+        start = np.searchsorted(hashes, key, side="left")
+        stop = np.searchsorted(hashes, key, side="right")
+        ranks = order[start:stop]
+        # a hash can be shared by different signatures
+        return ranks[(signatures[ranks] == row).all(axis=1)]
+
+    def is_unique(self, mask):
+        """returns True if no other layout gives the same ray results"""
+        num_atoms = bin(mask).count("1")
+        return len(self.ranks_for(self.get_signature(mask), num_atoms)) == 1
+
+    def layouts_for(self, responses, num_atoms=None, chunk_size=1 << 20):
+        """
+        finds every layout that gives the ray results seen
+        :param responses: dictionary of entry tuple to find_exit result, as
+        kept by Player
+        :param num_atoms: atoms in the layouts, None for every count
+        :param chunk_size: rows compared at a time when scanning
+        :return: uint64 array of interior masks
+        """
+        columns = [self._edges.index(entry) for entry in responses]
+        codes = np.array([encode_outcome(result, self._board_size)
+                          for result in responses.values()], np.uint8)
+        atom_counts = range(1, self._max_atoms + 1) if num_atoms is None \
+            else [num_atoms]
+
+        found = []
+        for count in atom_counts:
+            masks, signatures = self._sections[count][:2]
+            if len(set(columns)) == self._num_edges:
+                # every ray known, the hash index has the answer
+                signature = np.zeros(self._num_edges, np.uint8)
+                signature[columns] = codes
+                found.append(masks[self.ranks_for(signature, count)])
+                continue
+            for start in range(0, len(masks), chunk_size):
+                rows = signatures[start:start + chunk_size, columns]
+                found.append(masks[start:start + chunk_size][
+                    (rows == codes).all(axis=1)])
+        return np.concatenate(found) if found else np.zeros(0, np.uint64)
+
+
+def main():
+    """command line build of the signature database"""
+    parser = argparse.ArgumentParser(
+        description="write the ray signature of every atom layout to a file")
+    parser.add_argument("path", nargs="?", default="signatures.bin")
+    parser.add_argument("--max-atoms", type=int, default=5)
+    parser.add_argument("--board-size", type=int, default=BOARD_SIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+    build_database(args.path, args.max_atoms, args.board_size, args.workers)
+
+
+if __name__ == '__main__':
+    main()
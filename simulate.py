@@ -0,0 +1,242 @@
+import argparse
+import time
+from collections import Counter
+from multiprocessing import Pool
+from random import Random
+
+from board_geometry import BOARD_SIZE, edge_cells
+from engine import GameEngine
+
+SHOOT = "shoot"
+GUESS = "guess"
+
+
+def unshot_edges(engine):
+    """return edge squares whose ray result is not known yet"""
+    moves = engine.get_moves()
+    return [edge for edge in edge_cells(engine.get_board().get_board_size())
+            if edge not in moves]
+
+
+def unguessed_squares(engine):
+    """return interior squares not guessed yet"""
+    guesses = engine.get_atom_guesses()
+    inner = engine.get_board().get_board_size() - 2
+    return [(row, column) for row in range(1, inner + 1)
+            for column in range(1, inner + 1) if (row, column) not in guesses]
+
+
+def random_strategy(engine, rng):
+    """
+    picks any new ray or guess at random, the baseline to beat
+    :param engine: GameEngine being played
+    :param rng: Random for this game
+    :return: (SHOOT, entry tuple) or (GUESS, square tuple)
+    """
+    moves = [(SHOOT, edge) for edge in unshot_edges(engine)] + \
+        [(GUESS, square) for square in unguessed_squares(engine)]
+    return rng.choice(moves)
+
+
+def deduce_strategy(engine, rng):
+    """
+    shoots new rays in random order until the solver leaves one layout or
+    the edges run out, then guesses the square holding an atom in the most
+    layouts still possible.  Needs a board small enough for the solver
+    :param engine: GameEngine being played
+    :param rng: Random for this game
+    :return: (SHOOT, entry tuple) or (GUESS, square tuple)
+    """
+    edges = unshot_edges(engine)
+    # counting layouts is slow while few rays are known and almost never
+    # finds a single one, so it waits for a third of the edges
+    if edges and (len(edges) > len(engine.get_moves()) * 2 or
+                  engine.count_layouts() > 1):
+        return SHOOT, rng.choice(edges)
+
+    solver = engine.get_solver()
+    guesses = engine.get_atom_guesses()
+    votes = Counter(square for layout in solver.layouts()
+                    for square in solver.atom_cells(layout)
+                    if square not in guesses)
+    return GUESS, votes.most_common(1)[0][0]
+
+
+STRATEGIES = {
+    "random": random_strategy,
+    "deduce": deduce_strategy,
+}
+
+
+class SimulationStats:
+    """
+    class to add up game results as they come in, so millions of games
+    never need to be held at once.  Stats from different workers merge
+    """
+
+    def __init__(self):
+        """initialize empty totals"""
+        self._games = 0
+        self._wins = 0
+        self._unfinished = 0
+        self._shots = 0
+        self._guesses = 0
+        self._scores = Counter()
+
+    def add_game(self, won, finished, points, shots, guesses):
+        """
+        adds one game
+        :param won: True if every atom was found
+        :param finished: False if the game hit the move limit
+        :param points: points left at the end
+        :param shots: rays shot
+        :param guesses: atom guesses made
+        """
+        self._games += 1
+        self._wins += won
+        self._unfinished += not finished
+        self._shots += shots
+        self._guesses += guesses
+        self._scores[points] += 1
+
+    def merge(self, other):
+        """adds another SimulationStats' totals to these"""
+        self._games += other._games
+        self._wins += other._wins
+        self._unfinished += other._unfinished
+        self._shots += other._shots
+        self._guesses += other._guesses
+        self._scores.update(other._scores)
+
+    def get_games(self):
+        """return games added"""
+        return self._games
+
+    def get_win_rate(self):
+        """return share of games won"""
+        return self._wins / self._games if self._games else 0.0
+
+    def get_mean_score(self):
+        """return mean points left at the end of a game"""
+        if not self._games:
+            return 0.0
+        return sum(points * count for points, count in
+                   self._scores.items()) / self._games
+
+    def get_score_counts(self):
+        """return dictionary of points left to games ending with them"""
+        return dict(sorted(self._scores.items()))
+
+    def summary(self):
+        """return the totals as a dictionary"""
+        games = self._games or 1
+        return {"games": self._games,
+                "win_rate": self.get_win_rate(),
+                "unfinished": self._unfinished,
+                "mean_score": self.get_mean_score(),
+                "mean_shots": self._shots / games,
+                "mean_guesses": self._guesses / games,
+                "scores": self.get_score_counts()}
+
+
+def game_seed(seed, game):
+    """return the seed of one game, the same whichever worker plays it"""
+    return seed << 32 | game
+
+
+def play_game(strategy, num_atoms, seed, board_size=BOARD_SIZE,
+              max_moves=500):
+    """
+    plays one game with a strategy
+    :param strategy: callable(engine, rng) returning the next move
+    :param num_atoms: atoms hidden on the board
+    :param seed: seed for the atoms and the strategy's choices
+    :param board_size: squares along one side of the board, rim included
+    :param max_moves: moves before a stalled game is given up
+    :return: won, finished, points, shots, guesses
+    """
+    rng = Random(seed)
+    inner = board_size - 2
+    squares = [(row, column) for row in range(1, inner + 1)
+               for column in range(1, inner + 1)]
+    engine = GameEngine(rng.sample(squares, num_atoms), board_size)
+
+    shots = guesses = 0
+    for move in range(max_moves):
+        if engine.is_over():
+            break
+        action, square = strategy(engine, rng)
+        if action == SHOOT:
+            engine.shoot_ray(*square)
+            shots += 1
+        else:
+            engine.guess_atom(*square)
+            guesses += 1
+    return engine.is_won(), engine.is_over(), engine.get_score(), shots, \
+        guesses
+
+
+def play_chunk(task):
+    """worker side of run_simulation: plays games first to last - 1"""
+    strategy, num_atoms, seed, first, last, board_size = task
+    stats = SimulationStats()
+    for game in range(first, last):
+        stats.add_game(*play_game(strategy, num_atoms, game_seed(seed, game),
+                                  board_size))
+    return stats
+
+
+def run_simulation(strategy, num_games, num_atoms=4, seed=0, workers=None,
+                   chunk_size=200, board_size=BOARD_SIZE, progress=None):
+    """
+    plays many games over a process pool.  Game n is always seeded from
+    seed and n, so the totals do not depend on the number of workers or the
+    order chunks finish in
+    :param strategy: module level callable(engine, rng), so workers can
+    load it
+    :param num_games: games to play
+    :param num_atoms: atoms hidden in each game
+    :param seed: seed for the whole run
+    :param workers: processes to use, one per core if None
+    :param chunk_size: games handed to a worker at a time
+    :param board_size: squares along one side of the board, rim included
+    :param progress: callable(stats, seconds) run after each chunk, or None
+    :return: SimulationStats, games per second
+    """
+    tasks = [(strategy, num_atoms, seed, first,
+              min(first + chunk_size, num_games), board_size)
+             for first in range(0, num_games, chunk_size)]
+    stats = SimulationStats()
+    start = time.perf_counter()
+    with Pool(workers) as pool:
+        for chunk_stats in pool.imap_unordered(play_chunk, tasks):
+            stats.merge(chunk_stats)
+            if progress is not None:
+                progress(stats, time.perf_counter() - start)
+    seconds = time.perf_counter() - start
+    return stats, num_games / seconds if seconds else 0.0
+
+
+def main():
+    """command line self play run"""
+    parser = argparse.ArgumentParser(
+        description="play Blackbox games with a strategy and report results")
+    parser.add_argument("--strategy", choices=sorted(STRATEGIES),
+                        default="deduce")
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--atoms", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=200)
+    args = parser.parse_args()
+
+    stats, rate = run_simulation(STRATEGIES[args.strategy], args.games,
+                                 args.atoms, args.seed, args.workers,
+                                 args.chunk_size)
+    for name, value in stats.summary().items():
+        print("%s: %s" % (name, value))
+    print("games per second: %.1f" % rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+from itertools import combinations
+from math import comb
+
+from bit_board import RayTables
+from board_geometry import BOARD_SIZE
+
+
+class LayoutSolver:
+    """
+    class to work out every atom layout that agrees with the rays shot and
+    the atoms guessed so far.  Layouts are interior masks as used by
+    BitBoard.  The search only branches on squares an observed ray actually
+    looks at, and drops a partial layout as soon as a ray it settles comes
+    out wrong.  Squares no ray depends on are counted, not searched
+    """
+
+    def __init__(self, num_atoms, board_size=BOARD_SIZE):
+        """
+        initialize a solver with nothing observed yet
+        :param num_atoms: atoms hidden on the board
+        :param board_size: squares along one side of the board, rim included
+        """
+        self._tables = RayTables.for_size(board_size)
+        self._num_atoms = num_atoms
+        inner = board_size - 2
+        self._interior = (1 << inner * inner) - 1
+        self._shots = {}
+        self._atoms = 0
+        self._empty = 0
+
+    @classmethod
+    def from_player(cls, player, num_atoms, board_size=BOARD_SIZE):
+        """
+        build a solver from a Player's move and guess history
+        :param player: Player whose moves and guesses have been recorded
+        :param num_atoms: atoms hidden on the board
+        :param board_size: squares along one side of the board, rim included
+        :return: LayoutSolver
+        """
+        solver = cls(num_atoms, board_size)
+        for entry, result in player.get_moves().items():
+            solver.add_shot(entry, result)
+        for guess, correct in player.get_atom_guesses().items():
+            solver.add_guess(guess, correct)
+        return solver
+
+    def get_num_atoms(self):
+        """return atoms hidden on the board"""
+        return self._num_atoms
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._tables.board_size
+
+    def get_shots(self):
+        """return dictionary of entry tuple to observed find_exit result"""
+        return self._shots
+
+    def add_shot(self, entry, result):
+        """
+        record what a ray did
+        :param entry: entry tuple
+        :param result: 0 for hit, 1 for reflection or exit tuple
+        """
+        entry = tuple(entry)
+        self._shots[entry] = result
+        if result not in (0, 1):
+            # rays run the same path backwards, so the exit square's ray is
+            # known too and pins the path down from the other end
+            self._shots[tuple(result)] = entry
+
+    def add_guess(self, guess, correct):
+        """
+        record an atom guess
+        :param guess: (row, column) tuple guessed
+        :param correct: True if an atom was there
+        """
+        bit = self._tables.cell_bit(*guess)
+        if correct:
+            self._atoms |= bit
+        else:
+            self._empty |= bit
+
+    def settle(self, pending, atoms, decided):
+        """
+        moves every pending ray on as far as the decided squares allow.  A
+        ray that did not hit cannot have an atom straight in front of it, so
+        those squares are marked empty without branching on them
+        :param pending: list of (observed result, state) of unsettled rays
+        :param atoms: mask of squares holding an atom
+        :param decided: mask of squares known to hold an atom or not
+        :return: list of (observed result, state, unknown mask) still
+        unsettled and the new decided mask.  The list is None if a ray came
+        out wrong
+        """
+        tables = self._tables
+        lookahead = tables.lookahead
+        next_state = tables.next_state
+        outcome = tables.outcome
+        changed = True
+        while changed:
+            changed = False
+            still_pending = []
+            for result, state in pending:
+                unknown = 0
+                while outcome[state] is None:
+                    middle, large, small = lookahead[state]
+                    unknown = (middle | large | small) & ~decided
+                    if unknown:
+                        break
+                    hood = (1 if atoms & middle else 0) | \
+                        (2 if atoms & large else 0) | \
+                        (4 if atoms & small else 0)
+                    state = next_state[state * 8 + hood]
+                if unknown:
+                    if result != 0 and unknown & middle:
+                        decided |= middle
+                        changed = True
+                    still_pending.append((result, state))
+                elif outcome[state] != result:
+                    return None, decided
+            pending = still_pending
+        return pending, decided
+
+    def partial_layouts(self):
+        """
+        yield every group of layouts that settles all observed rays.  A
+        group is atoms placed so far, the mask of squares still free, and
+        how many more atoms go into those free squares in any arrangement
+        """
+        entry_state = self._tables.entry_state
+        lookahead = self._tables.lookahead
+        interior = self._interior
+        # rays that came out somewhere pin squares down fastest, so they
+        # are followed before hits
+        pending = sorted(((result, entry_state[entry])
+                          for entry, result in self._shots.items()),
+                         key=lambda ray: ray[0] == 0)
+        decided = self._atoms | self._empty
+        placed = bin(self._atoms).count("1")
+        if placed > self._num_atoms:
+            return
+        stack = [(self._atoms, decided, pending, placed)]
+        while stack:
+            atoms, decided, pending, placed = stack.pop()
+            need = self._num_atoms - placed
+            if not need:
+                # every atom is placed, so the rest of the board is empty
+                decided = interior
+            pending, decided = self.settle(pending, atoms, decided)
+            if pending is None:
+                continue
+
+            free = interior & ~decided
+            if need > bin(free).count("1"):
+                continue
+            if not pending:
+                yield atoms, free, need
+                continue
+
+            # an atom straight ahead stops the ray whatever is beside it, so
+            # the middle square goes first and the sides stay free after a hit
+            middle, large, small = lookahead[pending[0][1]]
+            unknown = (middle | large | small) & ~decided
+            branch_bit = unknown & middle or unknown & -unknown
+            decided |= branch_bit
+            stack.append((atoms, decided, pending, placed))
+            if need:
+                stack.append((atoms | branch_bit, decided, pending,
+                              placed + 1))
+
+    def count(self):
+        """return how many layouts agree with everything observed"""
+        return sum(comb(bin(free).count("1"), need)
+                   for atoms, free, need in self.partial_layouts())
+
+    def layouts(self):
+        """yield the interior mask of every layout that agrees"""
+        for atoms, free, need in self.partial_layouts():
+            free_bits = []
+            while free:
+                free_bits.append(free & -free)
+                free &= free - 1
+            for chosen in combinations(free_bits, need):
+                yield atoms | sum(chosen)
+
+    def atom_cells(self, layout):
+        """return the (row, column) tuples of the atoms in a layout mask"""
+        inner = self._tables.board_size - 2
+        cells = []
+        for num in range(inner * inner):
+            if layout >> num & 1:
+                cells.append((num // inner + 1, num % inner + 1))
+        return cells
@@ -0,0 +1,205 @@
+from bisect import bisect_left, bisect_right, insort
+
+from board_geometry import BOARD_SIZE, HEADINGS, entry_heading, \
+    lookahead_offsets, turn
+
+
+class SparseBoard:
+    """
+    class to hold a few atoms on a very large board.  Atoms are indexed by
+    row and by column so a ray jumps straight to the next square where an
+    atom could turn it, instead of walking every empty square
+    """
+
+    __slots__ = ('_board_size', '_atoms', '_rows_by_column',
+                 '_columns_by_row')
+
+    def __init__(self, list_atoms=(), board_size=BOARD_SIZE):
+        """initialization of the atom set and its row and column indexes"""
+        self._board_size = board_size
+        self._atoms = set()
+        self._rows_by_column = {}
+        self._columns_by_row = {}
+        for row, column in list_atoms:
+            self._atoms.add((row, column))
+        for row, column in sorted(self._atoms):
+            self._rows_by_column.setdefault(column, []).append(row)
+            self._columns_by_row.setdefault(row, []).append(column)
+
+    def add_atom(self, row, column):
+        """puts an atom on a square, keeping the row and column indexes"""
+        if (row, column) not in self._atoms:
+            self._atoms.add((row, column))
+            insort(self._rows_by_column.setdefault(column, []), row)
+            insort(self._columns_by_row.setdefault(row, []), column)
+
+    def remove_atom(self, row, column):
+        """takes the atom off a square, if there is one"""
+        if (row, column) in self._atoms:
+            self._atoms.remove((row, column))
+            self._rows_by_column[column].remove(row)
+            self._columns_by_row[row].remove(column)
+
+    def get_atoms(self):
+        """return sorted list of (row, column) atom tuples"""
+        return sorted(self._atoms)
+
+    def get_board_size(self):
+        """return squares along one side of the board, rim included"""
+        return self._board_size
+
+    def has_atom(self, row, column):
+        """returns True if an atom sits on the square"""
+        return (row, column) in self._atoms
+
+    def get_board_item(self, row, column):
+        """returns 'x' for an atom, 'o' for a corner and '' otherwise"""
+        last = self._board_size - 1
+        if row in (0, last) and column in (0, last):
+            return "o"
+        elif (row, column) in self._atoms:
+            return "x"
+        return ""
+
+    def neighbourhood(self, row, column, heading):
+        """returns True/False for the middle, large and small squares ahead"""
+        return [(row + off_row, column + off_column) in self._atoms
+                for off_row, off_column in lookahead_offsets(heading)]
+
+    def next_turn_point(self, row, column, heading):
+        """
+        finds how far a ray can go straight on before an atom is in one of
+        the three squares in front of it
+        :param row: current row
+        :param column: current column
+        :param heading: current heading
+        :return: number of steps, or None if the ray reaches the rim first
+        """
+        step_row, step_column = HEADINGS[heading]
+        if step_row:
+            lines, position, index = (column - 1, column, column + 1), row, \
+                self._rows_by_column
+        else:
+            lines, position, index = (row - 1, row, row + 1), column, \
+                self._columns_by_row
+        forward = step_row + step_column > 0
+
+        nearest = None
+        for line in lines:
+            atoms = index.get(line)
+            if not atoms:
+                continue
+            if forward:
+                found = bisect_right(atoms, position)
+                if found < len(atoms):
+                    distance = atoms[found] - position - 1
+                    if nearest is None or distance < nearest:
+                        nearest = distance
+            else:
+                found = bisect_left(atoms, position)
+                if found > 0:
+                    distance = position - atoms[found - 1] - 1
+                    if nearest is None or distance < nearest:
+                        nearest = distance
+        return nearest
+
+    def trace(self, entry_x, entry_y):
+        """
+        follows a ray from an edge square, jumping between turn points
+        :param entry_x: entry point of row
+        :param entry_y: entry point of column
+        :return: returns 0 if hit, 1 if reflection, otherwise exit tuple
+        """
+        last = self._board_size - 1
+        if self.get_board_item(entry_x, entry_y) == "o" or \
+                not (entry_x in (0, last) or entry_y in (0, last)):
+            raise ValueError("entry %s is not on the edge of the board"
+                             % ((entry_x, entry_y),))
+        heading = entry_heading(entry_x, entry_y, self._board_size)
+
+        # hit or reflection coming right off the edge
+        middle, large, small = self.neighbourhood(entry_x, entry_y, heading)
+        if middle:
+            return 0
+        elif large or small:
+            return 1
+
+        step_row, step_column = HEADINGS[heading]
+        row, column = entry_x + step_row, entry_y + step_column
+        while row not in (0, last) and column not in (0, last):
+            distance = self.next_turn_point(row, column, heading)
+            if distance is None:
+                # nothing left to turn the ray, run out to the rim
+                if step_row:
+                    return (last if step_row > 0 else 0), column
+                return row, (last if step_column > 0 else 0)
+            row += step_row * distance
+            column += step_column * distance
+
+            middle, large, small = self.neighbourhood(row, column, heading)
+            if middle:
+                return 0
+            heading = turn(heading, large, small)
+            step_row, step_column = HEADINGS[heading]
+            row, column = row + step_row, column + step_column
+
+        return row, column
+
+    def trace_strips(self, entry_x, entry_y):
+        """
+        follows a ray like trace and also reports every square it looked at
+        on the way, as strips three squares wide along its straight runs.
+        Only an atom put on or taken off one of those squares can change
+        the ray's result
+        :param entry_x: entry point of row
+        :param entry_y: entry point of column
+        :return: result as trace returns it, list of (vertical, centre line,
+        first, last) strips: squares first to last along the run, on the
+        lines either side of the centre line too.  Vertical strips run down
+        a column, the others along a row
+        """
+        last = self._board_size - 1
+        if self.get_board_item(entry_x, entry_y) == "o" or \
+                not (entry_x in (0, last) or entry_y in (0, last)):
+            raise ValueError("entry %s is not on the edge of the board"
+                             % ((entry_x, entry_y),))
+        heading = entry_heading(entry_x, entry_y, self._board_size)
+        strips = []
+        row, column = entry_x, entry_y
+        while True:
+            step_row, step_column = HEADINGS[heading]
+            distance = self.next_turn_point(row, column, heading)
+            if distance is None:
+                # nothing left to turn the ray, it runs out to the rim
+                if step_row:
+                    end_row, end_column = (last if step_row > 0 else 0), \
+                        column
+                else:
+                    end_row, end_column = row, \
+                        (last if step_column > 0 else 0)
+            else:
+                end_row = row + step_row * (distance + 1)
+                end_column = column + step_column * (distance + 1)
+            if step_row:
+                strips.append((True, column, min(row + step_row, end_row),
+                               max(row + step_row, end_row)))
+            else:
+                strips.append((False, row,
+                               min(column + step_column, end_column),
+                               max(column + step_column, end_column)))
+            if distance is None:
+                return (end_row, end_column), strips
+
+            row += step_row * distance
+            column += step_column * distance
+            middle, large, small = self.neighbourhood(row, column, heading)
+            if middle:
+                return 0, strips
+            elif row in (0, last) or column in (0, last):
+                # turned right off the edge
+                return 1, strips
+            heading = turn(heading, large, small)
+            step_row, step_column = HEADINGS[heading]
+            row, column = row + step_row, column + step_column
+            if row in (0, last) or column in (0, last):
+                return (row, column), strips